@@ -0,0 +1,103 @@
+"""
+Persistent, content-addressed cache for embeddings and audit verdicts.
+
+Entries live in a single SQLite file and are keyed by a SHA-256 of everything
+that feeds the result (text, model, prompt fingerprint, KB version, ...), so a
+change to any of those simply misses instead of returning a stale verdict.
+The file is size-bounded: once it grows past `max_bytes`, the least recently
+used entries are evicted.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+EVICT_CHECK_EVERY = 200   # puts between size checks
+EVICT_TARGET = 0.9        # evict down to this fraction of max_bytes
+
+
+def content_key(*parts):
+    """Stable hash of the given parts (strings, numbers, lists, dicts)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def signature_fingerprint(signature):
+    """Hash of a DSPy signature's instructions and fields; changes whenever the prompt does."""
+    fields = [(name, (f.json_schema_extra or {}).get("desc", "")) for name, f in signature.fields.items()]
+    return content_key(signature.instructions, fields)[:16]
+
+
+class AuditCache:
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache(last_used)")
+
+    # --- raw bytes ---
+    def get(self, kind, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM cache WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses[kind] += 1
+                return None
+            self._db.execute("UPDATE cache SET last_used=? WHERE key=?", (time.time(), key))
+            self.hits[kind] += 1
+            return row[0]
+
+    def put(self, kind, key, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache(key, kind, value, size, last_used) VALUES (?,?,?,?,?)",
+                (key, kind, value, len(value), time.time()),
+            )
+            self._puts += 1
+            if self._puts % EVICT_CHECK_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes: return
+        excess = total - int(self.max_bytes * EVICT_TARGET)
+        freed, doomed = 0, []
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY last_used"):
+            if freed >= excess: break
+            doomed.append((key,))
+            freed += size
+        self._db.executemany("DELETE FROM cache WHERE key=?", doomed)
+
+    # --- typed helpers ---
+    def get_json(self, kind, key):
+        raw = self.get(kind, key)
+        return None if raw is None else json.loads(raw)
+
+    def put_json(self, kind, key, value):
+        self.put(kind, key, json.dumps(value).encode("utf-8"))
+
+    def get_vector(self, kind, key):
+        raw = self.get(kind, key)
+        return None if raw is None else np.frombuffer(raw, dtype=np.float32)
+
+    def put_vector(self, kind, key, vector):
+        self.put(kind, key, np.asarray(vector, dtype=np.float32).tobytes())
+
+    def stats(self):
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "by_kind": {k: (self.hits[k], self.misses[k]) for k in sorted(set(self.hits) | set(self.misses))}}
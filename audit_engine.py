@@ -0,0 +1,1008 @@
+"""
+Headless audit pipeline.
+
+Everything between "here is some HTML" and "here are the findings" lives here, with
+no Streamlit import, so the same engine runs in the app, in scripts, batch jobs and
+benchmarks:
+
+    engine = AuditEngine(lm, kb_index=KBIndex.load(KB_PATH), rules=rules, overrides=overrides)
+    run = engine.audit(html, "virtual mailbox")
+    for finding in run:             # or: async for finding in run
+        print(finding["stream"], finding["status"], finding["label"], finding["header"])
+
+Findings are plain dicts with `stream` ("structure" or "facts"), `label`, `status`
+(PASS/FAIL/WARN), `header` and `quote`; FACT/STYLE findings also carry `route`
+("full" or "screened") and `route_reason` from the cascade pre-screen (see
+AuditorBot.screen_fact). They are yielded as soon as they are final, in document
+order within each stream, while the LLM calls behind them run on a bounded
+thread pool.
+"""
+import asyncio
+import importlib.util
+import json
+import re
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import dspy
+from bs4 import BeautifulSoup, Tag
+from bs4.element import PreformattedString
+
+from audit_cache import content_key, signature_fingerprint
+from instrumentation import AuditTrace
+from kb_index import KBIndex, top_k
+from retrieval import DenseRetriever, LexicalIndex, stem_tokenize
+from rule_matcher import RuleMatcher
+
+LLM_MODEL = "openai/gpt-4o"
+LLM_MAX_TOKENS = 300
+NO_CONTEXT = "No specific internal match found."
+STREAMS = ("structure", "facts")
+VERDICT_STATUSES = {"PASS", "FAIL", "WARN"}
+CLAIM_SIGNALS_VERSION = 3           # bump when the pre-screen rules change; invalidates memos
+OVERRIDES_MATCH_THRESHOLD = 0.2     # lexical score above which a sentence touches an override
+CASCADE_KB_SCORE = 0.5              # KB score that escalates a claim-free sentence; at the retrieval
+                                    # threshold nearly every sentence matched something and escalated
+OVERRIDES_TOP_K = 3                 # matching overrides sent with a sentence, besides the always-on ones
+OVERRIDES_FILTER_MIN = 20           # shorter lists are sent whole; filtering only pays off on long ones
+NO_OVERRIDES = "None apply."
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+LIST_TAGS = ("ul", "ol")
+BLOCK_TAGS = HEADING_TAGS + LIST_TAGS + ("p", "div", "li")
+Block = namedtuple("Block", ["tag", "text", "items"])  # items: direct <li> count, lists only
+
+# lxml is several times faster than html.parser on full CMS pages; optional.
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Cost estimate inputs (see AuditEngine.estimate). USD per 1M (input, output) tokens.
+LLM_PRICE_PER_MTOK = {"openai/gpt-4o": (2.50, 10.00)}
+CHARS_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 150    # DSPy field headers and formatting around each call
+COMPLETION_TOKENS = {"structure": 100, "fact": 120, "fact_batch_sentence": 60}
+
+
+# --- DSPY SIGNATURES ---
+class FactAuditSignature(dspy.Signature):
+    """
+    ROLE: Senior Content Auditor for iPostal1.
+    INSTRUCTIONS:
+    1. CHECK DEFINITION TRAP (Highest Priority):
+       - Does this sentence define "A Virtual Address" (universal) as HAVING digital features?
+       - FAIL PATTERN: "A virtual address is a location managed via an app."
+       - PASS PATTERN: "An iPostal1 virtual address includes an app."
+    2. CHECK OVERRIDES: If the claim contradicts the Overrides list -> FAIL.
+    3. CHECK TERMINOLOGY: "P.O. Box" refers to a competitor. Claims stating they lack features are TRUE.
+    4. CHECK PASSIVE VOICE: FAIL only if structure is truly passive.
+    5. CHECK OPERATIONAL DETAILS: Claims about LOGGING, PHOTOGRAPHING, or SCANNING THE EXTERIOR of mail are TRUE standard procedures.
+
+    OUTPUT: PASS, FAIL, or WARN.
+    """
+    sentence = dspy.InputField()
+    context = dspy.InputField(desc="Knowledge Base")
+    overrides = dspy.InputField(desc="Overrides List")
+    status = dspy.OutputField(desc="PASS, FAIL, or WARN")
+    reason = dspy.OutputField(desc="Reason")
+
+class StructureAuditSignature(dspy.Signature):
+    """
+    TASK: Audit this text block for AEO Structure (Chunking).
+    RULES:
+    1. SINGLE IDEA: Does it focus on ONE concept?
+    2. SELF-CONTAINED: Can it be understood in isolation?
+    OUTPUT: PASS or FAIL
+    """
+    paragraph = dspy.InputField()
+    status = dspy.OutputField(desc="PASS or FAIL")
+    reason = dspy.OutputField(desc="Reason")
+
+class _BatchFactFields(dspy.Signature):
+    sentences = dspy.InputField(desc="Numbered sentences from one paragraph")
+    context = dspy.InputField(desc="Knowledge Base, numbered to match the sentences")
+    overrides = dspy.InputField(desc="Overrides List")
+    verdicts = dspy.OutputField(desc='JSON list with exactly one {"status": "PASS|FAIL|WARN", "reason": "..."} object per numbered sentence, in order')
+
+# Same audit rules as FactAuditSignature, applied to every sentence of a paragraph in one call.
+BatchFactAuditSignature = _BatchFactFields.with_instructions(
+    FactAuditSignature.instructions
+    + "\n\nBATCH MODE: Audit EACH numbered sentence independently with the rules above, using its numbered"
+    " Knowledge Base entry. Return one verdict per sentence, in the same order."
+)
+
+class AuditorBot(dspy.Module):
+    def __init__(self):
+        super().__init__()
+        self.fact_check = dspy.ChainOfThought(FactAuditSignature)
+        self.fact_batch_check = dspy.ChainOfThought(BatchFactAuditSignature)
+        self.struct_check = dspy.ChainOfThought(StructureAuditSignature)
+
+    def audit_fact(self, sentence, context, overrides):
+        return self.fact_check(sentence=sentence, context=context, overrides=overrides)
+
+    def audit_fact_batch(self, sentences, contexts, overrides):
+        numbered = lambda items: "\n".join(f"{n}. {item}" for n, item in enumerate(items, 1))
+        return self.fact_batch_check(sentences=numbered(sentences), context=numbered(contexts), overrides=overrides)
+
+    def audit_structure(self, paragraph):
+        return self.struct_check(paragraph=paragraph)
+
+    # --- fact cascade ---
+    # Tier 1 is a deterministic pre-screen; only sentences it routes "full" reach
+    # FactAuditSignature on the main LM, the rest get screened_verdict() for free.
+    def screen_fact(self, sentence, kb_score, overrides_match, kb_threshold):
+        """Returns (route, why): route is "full" or "screened". kb_score is None without a KB match."""
+        if overrides_match: return "full", "overrides match"
+        if kb_score is not None and kb_score > kb_threshold: return "full", f"KB match ({kb_score:.2f})"
+        signal = find_claim_signal(sentence)
+        if signal: return "full", signal
+        return "screened", "no verifiable claim"
+
+    def screened_verdict(self, sentence):
+        if check_grammar_and_style(sentence):
+            return dspy.Prediction(status="WARN", reason="No verifiable claim, so not fact-checked; see the style flags.")
+        return dspy.Prediction(status="PASS", reason="No verifiable product claim (pre-screened, not sent to the fact check).")
+
+
+# --- TEXT HELPERS ---
+def split_sentences(text):
+    """
+    Splits text into sentences while ignoring periods in common abbreviations (U.S., U.K., Mr., etc.).
+    Strategy:
+    1. Use negative lookbehinds (?<!...) to ignore known abbreviations.
+    2. Use lookahead (?=[A-Z]|$) to only split if the next char is Uppercase or end-of-string.
+       This prevents splitting "U.S. government" where 'g' is lowercase.
+    """
+    # Pattern explanation:
+    # (?<!U\.S) -> Do not split if preceded by U.S
+    # (?<!\b[A-Z]) -> Do not split if preceded by a single capital letter (initials)
+    # [.!?]+ -> Split on punctuation
+    # (?:\s+(?=[A-Z])|$) -> Only if followed by whitespace+Capital Letter OR End of string
+
+    pattern = r'(?<!U\.S)(?<!U\.K)(?<!P\.O)(?<!Mr)(?<!Mrs)(?<!Ms)(?<!Dr)(?<!Inc)(?<!Ltd)(?<!\b[A-Z])[.!?]+(?:\s+(?=[A-Z])|$)'
+
+    chunks = re.split(pattern, text)
+    return [c.strip() for c in chunks if len(c.strip()) > 5]
+
+def check_grammar_and_style(sentence):
+    flags = []
+
+    # --- UPDATED SECTION: REFERENTIAL AMBIGUITY ---
+    # This regex looks for This, That, These, Those, It, or They at the start of a sentence.
+    # It captures the specific word found so you can see which one triggered the flag.
+    ambiguity_match = re.search(r'^\W*(This|That|These|Those|It|They)\b', sentence, re.IGNORECASE)
+    if ambiguity_match:
+        found_word = ambiguity_match.group(1).title() # Capitalize for the label
+        flags.append(f"Referential Ambiguity ('{found_word}' at start)")
+    # -----------------------------------------------
+
+    if sentence.strip().endswith('?') and len(sentence) > 20: flags.append("Rhetorical Question")
+    if re.search(r'\b(imagine|picture this|guess what)\b', sentence, re.IGNORECASE): flags.append("Hype Language")
+    if re.search(r'\b(was|were|is|are|been)\b\s+\w+\s+\bby\b', sentence, re.IGNORECASE): flags.append("Passive Voice (Regex)")
+    return flags
+
+
+# --- BLOCK EXTRACTION ---
+def _own_text(el, skip):
+    # Text of `el` without descendants in `skip`, which are extracted as blocks of their own.
+    parts = []
+    for child in el.children:
+        if isinstance(child, Tag):
+            if child.name not in skip: parts.append(_own_text(child, skip))
+        elif not isinstance(child, PreformattedString):  # comments, doctypes, CDATA
+            parts.append(str(child))
+    return "".join(parts)
+
+
+def extract_blocks(soup):
+    """
+    Content blocks in document order, each piece of text exactly once.
+    Headings, paragraphs and bullets are leaves. In a <div> (or <p>) wrapping other blocks,
+    each run of loose text between them is a block of its own, at its position among the
+    children, which are extracted on their own; paragraphs
+    inside a bullet are part of the bullet, nested lists are not. List containers are
+    kept as text-less blocks carrying their direct item count.
+    """
+    blocks = []
+
+    def visit(el):
+        name = el.name
+        if name in HEADING_TAGS:
+            blocks.append(Block(name, el.get_text(), None))
+        elif name in LIST_TAGS:
+            blocks.append(Block(name, "", len(el.find_all("li", recursive=False))))
+            walk(el)
+        elif name == "li":
+            blocks.append(Block(name, _own_text(el, LIST_TAGS), None))
+            for lst in el.find_all(LIST_TAGS):
+                if lst.find_parent(LIST_TAGS + ("li",)) is el: visit(lst)
+        elif name in ("p", "div"):
+            if el.find(BLOCK_TAGS) is None:
+                blocks.append(Block(name, el.get_text(), None))
+            else:
+                split_runs(el, name)
+        else:
+            walk(el)
+
+    def split_runs(el, name):
+        # "Before <p>inner</p> after" gives "Before", "inner", "after", never "Before  after".
+        run = []
+        def flush():
+            if "".join(run).strip(): blocks.append(Block(name, "".join(run), None))
+            run.clear()
+        def scan(node):
+            for child in node.children:
+                if isinstance(child, Tag):
+                    if child.name in BLOCK_TAGS:
+                        flush()
+                        visit(child)
+                    elif child.find(BLOCK_TAGS) is not None: scan(child)   # inline wrapper around blocks
+                    else: run.append(_own_text(child, ()))
+                elif not isinstance(child, PreformattedString):
+                    run.append(str(child))
+        scan(el)
+        flush()
+
+    def walk(el):
+        for child in el.children:
+            if isinstance(child, Tag): visit(child)
+
+    walk(soup)
+    return blocks
+
+
+# Pre-screen signals that a sentence makes a claim worth a full fact check, first match wins.
+CLAIM_SIGNALS = [
+    ("definition", re.compile(r"\b(?:a|an|the)\s+virtual\s+(?:address|mailbox|office)\s+(?:is|are|means|includes?|has|have|lets|gives)\b", re.IGNORECASE)),
+    ("number or price", re.compile(r"\d|\$|%|\b(?:free|one|two|three|four|five|ten|hundreds?|thousands?|fees?|costs?|charge[sd]?|price[sd]?|pricing|discount\w*|cheap\w*|affordable|no[\s-]cost)\b", re.IGNORECASE)),
+    ("absolute or superlative", re.compile(r"\b(?:always|never|every|all|any|guarantee[sd]?|unlimited|instant(?:ly)?|only|best|fastest|cheapest|most|first|no\s+one|anywhere|anytime)\b|#1", re.IGNORECASE)),
+    ("comparison", re.compile(r"\b(?:than|unlike|compared|versus|vs\.?)\b", re.IGNORECASE)),
+    ("capability", re.compile(r"\b(?:ipostal1|we|our|you|your)\b.{0,40}\b(?:can|will|lets?|allows?|includes?|offers?|provides?|supports?|accepts?|scans?|forwards?|ships?|shreds?|deposits?|receives?|views?|manages?|access(?:es)?|tracks?|stores?|register\w*|notariz\w*)\b", re.IGNORECASE)),
+    ("legal or compliance", re.compile(r"\b(?:legal|law|laws|irs|usps|form\s+1583|notary|compliant|compliance|license[sd]?|registered|tax)\b", re.IGNORECASE)),
+]
+
+def find_claim_signal(sentence):
+    """Name of the first claim signal in `sentence`, or None if it makes no checkable claim."""
+    for name, pattern in CLAIM_SIGNALS:
+        if pattern.search(sentence): return name
+    return None
+
+
+def parse_verdicts(raw, expected):
+    """
+    Parses a batch reply into `expected` {"status", "reason"} dicts, or None when the
+    reply is malformed (bad JSON, wrong count, unknown status) so callers can fall back.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", str(raw).strip())
+    try: items = json.loads(text)
+    except ValueError: return None
+    if not isinstance(items, list) or len(items) != expected: return None
+    verdicts = []
+    for item in items:
+        if not isinstance(item, dict): return None
+        status = str(item.get("status", "")).strip().upper()
+        if status not in VERDICT_STATUSES: return None
+        verdicts.append({"status": status, "reason": str(item.get("reason", ""))})
+    return verdicts
+
+
+# --- ORDERED DISPATCH ---
+class OrderedDispatcher:
+    """
+    Runs LLM calls on a bounded thread pool while keeping output in document order.
+    Findings are queued per stream ('structure' / 'facts'). A finding waiting on a
+    pending call holds back every finding queued after it on the same stream, so
+    each stream comes out top-to-bottom no matter which call finishes first.
+    Pass `pool` to share one executor (and so one in-flight limit) across audits.
+    """
+    def __init__(self, max_in_flight, pool=None):
+        self.owns_pool = pool is None
+        self.pool = pool or ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+        self.futures = []
+        self.jobs = []      # every future handed to the pool, for cancellation
+        self.streams = {s: deque() for s in STREAMS}
+
+    def _submit(self, fn, *args):
+        fut = self.pool.submit(fn, *args)
+        self.jobs.append(fut)
+        return fut
+
+    def submit(self, fn, *args):
+        fut = self._submit(fn, *args)
+        self.futures.append(fut)
+        return fut
+
+    def defer(self):
+        # Placeholder for a call whose inputs are not ready yet; see bind().
+        fut = Future()
+        self.futures.append(fut)
+        return fut
+
+    def bind(self, placeholder, fn, *args):
+        def relay(done):
+            if done.cancelled(): placeholder.cancel()
+            elif done.exception() is not None: placeholder.set_exception(done.exception())
+            else: placeholder.set_result(done.result())
+        self._submit(fn, *args).add_done_callback(relay)
+
+    def bind_batch(self, placeholders, fn, *args, fallback):
+        """
+        One call feeding several placeholders: `fn` returns a list aligned with them.
+        Placeholders whose entry is None (or all of them, if the call fails) are handed
+        to fallback(index) instead.
+        """
+        def relay(done):
+            if done.cancelled():
+                for ph in placeholders: ph.cancel()
+                return
+            results = done.result() if done.exception() is None else None
+            for i, ph in enumerate(placeholders):
+                if results is not None and results[i] is not None: ph.set_result(results[i])
+                else: fallback(i)
+        self._submit(fn, *args).add_done_callback(relay)
+
+    @staticmethod
+    def resolved(result):
+        # Already-finished future, for results carried over from an earlier run.
+        fut = Future()
+        fut.set_result(result)
+        return fut
+
+    def emit(self, stream, finding):
+        self.streams[stream].append((None, lambda _: [finding]))
+
+    def emit_pending(self, stream, future, render):
+        # render(result) -> list of findings once the call behind `future` is done.
+        self.streams[stream].append((future, render))
+
+    def drain(self, on_progress=None):
+        """Yields (stream, finding) in order as calls complete; on_progress(done, total) after each."""
+        total = len(self.futures)
+        try:
+            yield from self._flush()
+            for done, _ in enumerate(as_completed(self.futures), 1):
+                if on_progress: on_progress(done, total)
+                yield from self._flush()
+        finally:
+            if self.owns_pool: self.pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                for fut in self.jobs + self.futures: fut.cancel()
+
+    def _flush(self):
+        for stream, queue in self.streams.items():
+            while queue:
+                fut, render = queue[0]
+                if fut is not None and not fut.done(): break
+                queue.popleft()
+                for finding in render(fut.result() if fut is not None else None):
+                    yield stream, finding
+
+
+# --- PLANNING ---
+def _usage_tokens(pred):
+    # Prompt + completion tokens dspy reported for a call (0 when the LM reports none).
+    return sum((u.get("prompt_tokens") or 0) + (u.get("completion_tokens") or 0) for u in (pred.get_lm_usage() or {}).values())
+
+
+def approx_tokens(text):
+    # Rough GPT tokenizer ratio for English prose; only used for estimates and the gateway's budget.
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+class WorkUnit:
+    """
+    One unique LLM check (a structure check of a block, or a fact check of a sentence).
+    `future` resolves once and feeds every place in the document the same text appears.
+    """
+    def __init__(self, kind, text, block_key, future):
+        self.kind = kind
+        self.text = text
+        self.block_key = block_key  # first block it appears in; fact batches group on this
+        self.future = future
+        self.uses = 0
+
+
+class AuditPlan:
+    """
+    Everything an audit will do, worked out before any call is made: the findings
+    queued in document order, the deduplicated work units behind them, how fact
+    units batch into calls, and an `estimate` of LLM calls and tokens.
+    """
+    def __init__(self, dispatcher, memo_version, trace):
+        self.dispatcher = dispatcher
+        self.trace = trace
+        self.structure_units = {}   # block text -> WorkUnit
+        self.fact_units = {}        # sentence -> WorkUnit
+        self.fact_groups = []       # [[WorkUnit]], one LLM call each (before the cascade pre-screen)
+        self.routing = {}           # sentence -> (route, why), filled in by execute()
+        self.reuse = {"blocks": 0, "changed": 0, "checks": 0}
+        self.memo = {"version": memo_version, "blocks": {}}
+        self.estimate = None
+
+    @property
+    def duplicates(self):
+        units = list(self.structure_units.values()) + list(self.fact_units.values())
+        return sum(u.uses - 1 for u in units)
+
+    def summary(self):
+        e = self.estimate
+        text = (f"{e['llm_calls']} LLM call(s) ({e['structure_calls']} structure, {e['fact_calls']} fact) "
+                f"for {e['checks']} check(s)")
+        if e["duplicates"]: text += f", {e['duplicates']} repeat(s) merged"
+        if e["reused"]: text += f", {e['reused']} reused from the last run"
+        text += f" · ~{e['prompt_tokens'] + e['completion_tokens']:,} tokens"
+        if e["cost_usd"] is not None: text += f" (≈ ${e['cost_usd']:.3f})"
+        return text
+
+
+# --- ENGINE ---
+class AuditRun:
+    """
+    One audit. Iterate it for findings. `plan` is set (and `on_plan(plan)` called) once
+    the document has been planned, before any LLM call goes out. Once exhausted, `memo`
+    holds the per-block LLM results to pass as `previous` to the next audit of the same
+    draft, and `reuse` counts what was carried over from `previous`. `trace` collects
+    timings, token counts and errors for the whole audit (see instrumentation.py).
+    """
+    def __init__(self, engine, html, target_kw, previous=None, on_progress=None, on_plan=None):
+        self.engine = engine
+        self.trace = AuditTrace()
+        if engine.kb_error is not None: self.trace.error("kb_load", engine.kb_error)
+        self.html = html
+        self.target_kw = target_kw
+        self.previous = previous
+        self.on_progress = on_progress
+        self.on_plan = on_plan
+        self.plan = None
+        self.memo = None
+        self.reuse = {"blocks": 0, "changed": 0, "checks": 0}
+
+    def __iter__(self):
+        return self.engine._run(self)
+
+    async def _aiter(self):
+        # Steps the generator on a worker thread so an event loop is never blocked on LLM calls.
+        it, loop, done = iter(self), asyncio.get_running_loop(), object()
+        while True:
+            finding = await loop.run_in_executor(None, next, it, done)
+            if finding is done: return
+            yield finding
+
+    def __aiter__(self):
+        return self._aiter()
+
+
+class AuditEngine:
+    """
+    `concurrency` bounds in-flight LLM calls per audit. Batch callers can instead pass a
+    shared `executor` (one limit across every audit using this engine) and
+    `embed_concurrency` to cap simultaneous embedding requests. Fact checks for up to
+    `fact_batch_size` sentences of the same paragraph share one LLM call (1 disables).
+    `retriever` picks the KB facts each sentence is checked against (see retrieval.py);
+    the default is dense retrieval through `embedder`. With `cascade`, a pre-screen settles
+    sentences that make no checkable claim and have no KB or overrides match without an
+    LLM call; `cascade_kb_score` (default CASCADE_KB_SCORE) is the KB match score
+    that escalates a sentence on its own. With a `gateway` (see llm_gateway.py), every LLM
+    call goes through its rate budgets, retries and in-flight coalescing at `priority`
+    ("interactive" or "batch"). Once the overrides list reaches OVERRIDES_FILTER_MIN
+    entries, fact checks get only the overrides relevant to their sentences (up to
+    `overrides_top_k` keyword matches each) plus the ones marked {"text": ..., "always": true};
+    shorter lists, or `overrides_top_k=0`, are sent whole. `kb_error` is why `kb_index` is
+    empty, if it failed to load; every audit's trace records it.
+    """
+    def __init__(self, lm, kb_index=None, rules=(), overrides=(), embedder=None, cache=None, concurrency=8,
+                 executor=None, embed_concurrency=None, fact_batch_size=4, retriever=None, cascade=True,
+                 cascade_kb_score=None, gateway=None, priority="interactive", overrides_top_k=OVERRIDES_TOP_K,
+                 kb_error=None):
+        self.lm = lm
+        self.gateway = gateway
+        self.priority = priority
+        self.kb_index = kb_index if kb_index is not None else KBIndex.empty()
+        self.kb_error = kb_error
+        self.retriever = retriever or DenseRetriever(self.kb_index)
+        self.rules = list(rules)
+        self.rule_matcher = RuleMatcher(self.rules)
+        # Entries are strings, or {"text": ..., "always": true} for overrides sent with every fact check.
+        self.overrides = [o["text"] if isinstance(o, dict) else o for o in overrides]
+        self.always_overrides = tuple(i for i, o in enumerate(overrides) if isinstance(o, dict) and o.get("always"))
+        self.overrides_top_k = overrides_top_k
+        self.filter_overrides = bool(overrides_top_k) and len(self.overrides) >= OVERRIDES_FILTER_MIN
+        self.overrides_index = LexicalIndex(self.overrides, analyzer=stem_tokenize)
+        self.cascade = cascade
+        self.cascade_kb_score = CASCADE_KB_SCORE if cascade_kb_score is None else cascade_kb_score
+        self.embedder = embedder
+        self.cache = cache
+        self.concurrency = concurrency
+        self.fact_batch_size = max(1, fact_batch_size)
+        self.executor = executor
+        self.embed_slots = threading.BoundedSemaphore(embed_concurrency) if embed_concurrency else None
+        self.bot = AuditorBot()
+
+        self.llm_model = getattr(lm, "model", LLM_MODEL)
+        self.fact_prompt_hash = signature_fingerprint(FactAuditSignature)
+        self.batch_prompt_hash = signature_fingerprint(BatchFactAuditSignature)
+        self.struct_prompt_hash = signature_fingerprint(StructureAuditSignature)
+        self.overrides_hash = content_key(list(overrides), self.overrides_top_k if self.filter_overrides else 0)[:16]
+        # Per-block memos from an earlier run are only valid while all of these hold.
+        self.memo_version = content_key(self.llm_model, self.fact_prompt_hash, self.batch_prompt_hash,
+                                        self.struct_prompt_hash, self.kb_index.version, self.overrides_hash,
+                                        self.retriever.fingerprint,
+                                        (CLAIM_SIGNALS_VERSION, self.cascade_kb_score) if self.cascade else None)
+        # Prompt tokens of each signature before its inputs, for estimates and the gateway's budget.
+        self.base_prompt_tokens = {
+            "structure": PROMPT_OVERHEAD_TOKENS + approx_tokens(StructureAuditSignature.instructions),
+            "fact": PROMPT_OVERHEAD_TOKENS + approx_tokens(FactAuditSignature.instructions),
+            "fact_batch": PROMPT_OVERHEAD_TOKENS + approx_tokens(BatchFactAuditSignature.instructions),
+        }
+        # Overrides text in a typical fact-check prompt: always-on ones plus top-k average-sized matches.
+        if self.filter_overrides:
+            avg = sum(map(approx_tokens, self.overrides)) / len(self.overrides)
+            matched = min(self.overrides_top_k, len(self.overrides) - len(self.always_overrides))
+            self.overrides_tokens = sum(approx_tokens(self.overrides[i]) for i in self.always_overrides) + round(matched * avg)
+        else:
+            self.overrides_tokens = approx_tokens(self.overrides_text(range(len(self.overrides))))
+        # Typical retrieved context: the top-k KB facts joined.
+        facts = self.kb_index.facts
+        self.context_tokens = (self.retriever.k * sum(map(approx_tokens, facts)) // len(facts)) if len(facts) else approx_tokens(NO_CONTEXT)
+
+    def audit(self, html, target_kw, previous=None, on_progress=None, on_plan=None):
+        """
+        Audits `html` against `target_kw`. `previous` is the `memo` of an earlier run;
+        LLM results for blocks unchanged since then are reused. `on_plan(plan)` is called
+        with the AuditPlan before any LLM call is dispatched, and `on_progress(done, total,
+        message)` as work completes, both from the iterating thread.
+        """
+        return AuditRun(self, html, target_kw, previous, on_progress, on_plan)
+
+    # --- embeddings & retrieval ---
+    def embed_texts(self, texts, trace=None):
+        """
+        Embeds every unique text in batched requests, skipping texts already in the audit
+        cache. Returns ({text: vector}, {text: error message}).
+        """
+        trace = trace or AuditTrace()
+        vecs, todo = {}, []
+        for t in dict.fromkeys(texts):
+            cached = self.cache.get_vector("embedding", content_key(self.embedder.name, t)) if self.cache else None
+            if self.cache: trace.cache_lookup("embedding", cached is not None)
+            if cached is not None: vecs[t] = cached
+            else: todo.append(t)
+        fresh, errors = {}, {}
+        if todo:
+            with trace.stage("embed_request"):   # includes waiting for an embedding slot
+                if self.embed_slots:
+                    with self.embed_slots: fresh, errors = self.embedder.embed(todo)
+                else: fresh, errors = self.embedder.embed(todo)
+            trace.count("embeddings", len(todo))
+            if errors: trace.count("embedding_failures", len(errors))
+        if self.cache:
+            for t, v in fresh.items():
+                self.cache.put_vector("embedding", content_key(self.embedder.name, t), v)
+        vecs.update(fresh)
+        return vecs, errors
+
+    def route_facts(self, sentences, kb_scores, override_matches=None):
+        """
+        {sentence: (route, why)} from the cascade pre-screen, given each sentence's best KB
+        match score and its matching overrides (see match_overrides); everything is "full"
+        without the cascade.
+        """
+        if not self.cascade: return {s: ("full", "cascade off") for s in sentences}
+        if override_matches is None: override_matches = self.match_overrides(sentences)
+        return {s: self.bot.screen_fact(s, kb_scores.get(s), bool(override_matches.get(s)), self.cascade_kb_score) for s in sentences}
+
+    # --- overrides ---
+    def match_overrides(self, sentences):
+        """{sentence: indices of the overrides it matches, best first} (at most overrides_top_k when set)."""
+        if not self.overrides or not sentences: return {s: () for s in sentences}
+        sims = self.overrides_index.scores(sentences)
+        k = self.overrides_top_k or len(self.overrides)
+        top_idx, top_sims = top_k(sims, k)
+        return {s: tuple(int(i) for i, sc in zip(idx, scores) if sc > OVERRIDES_MATCH_THRESHOLD)
+                for s, idx, scores in zip(sentences, top_idx, top_sims)}
+
+    def prompt_overrides(self, matched):
+        """Override indices to send with a fact check of sentences matching `matched`, in list order."""
+        if not self.filter_overrides: return tuple(range(len(self.overrides)))
+        return tuple(sorted(set(self.always_overrides) | set(matched)))
+
+    def overrides_text(self, ids):
+        return "; ".join(self.overrides[i] for i in ids) if ids else NO_OVERRIDES
+
+    def _embeds_for_retrieval(self):
+        return self.retriever.needs_embeddings and self.embedder is not None and len(self.kb_index) > 0
+
+    # --- LLM jobs (run on worker threads) ---
+    def _lm_call(self, signature, call, trace, key=None, tokens=0):
+        # One LLM round trip on this engine's LM, timed and with its token usage recorded.
+        # Through the gateway, `key` merges identical in-flight calls and `tokens` (prompt +
+        # completion estimate) is charged to its budget until the real usage is known.
+        def timed():
+            t0 = time.perf_counter()
+            try:
+                with dspy.context(lm=self.lm, track_usage=True):
+                    pred = call()
+            except Exception:
+                trace.record_call(signature, time.perf_counter() - t0, ok=False)
+                raise
+            trace.record_call(signature, time.perf_counter() - t0, pred.get_lm_usage())
+            return pred
+        if self.gateway is None: return timed()
+        return self.gateway.call(key, tokens, timed, priority=self.priority, trace=trace, used=_usage_tokens)
+
+    def _cached_call(self, kind, signature, key, call, trace, tokens=0):
+        cached = self.cache.get_json(kind, key) if self.cache else None
+        if self.cache: trace.cache_lookup(kind, bool(cached))
+        if cached: return dspy.Prediction(**cached)
+        pred = self._lm_call(signature, call, trace, key, tokens)
+        if self.cache: self.cache.put_json(kind, key, {"status": pred.status, "reason": pred.reason})
+        return pred
+
+    def run_structure_check(self, paragraph, trace=None):
+        # Failures are dropped, same as the app's original inline `except: pass`, but land in the trace.
+        trace = trace or AuditTrace()
+        key = content_key("structure", self.llm_model, self.struct_prompt_hash, paragraph)
+        try:
+            return self._cached_call("structure", "StructureAuditSignature", key, lambda: self.bot.audit_structure(paragraph=paragraph), trace,
+                                     self.base_prompt_tokens["structure"] + approx_tokens(paragraph) + COMPLETION_TOKENS["structure"])
+        except Exception as e:
+            trace.error("structure", e)
+            return None
+
+    def _fact_key(self, prompt_hash, sentence, ctx, overrides):
+        # The key covers the retrieved context too, so a failed embedding never reuses a KB-backed verdict,
+        # and the overrides text the sentence is checked against rather than the whole list.
+        return content_key("fact", self.llm_model, prompt_hash, self.kb_index.version, overrides, sentence, ctx)
+
+    def run_fact_check(self, sentence, ctx, trace=None, overrides=None):
+        """`overrides` are the override indices for the prompt (default: those the sentence matches)."""
+        trace = trace or AuditTrace()
+        if overrides is None: overrides = self.prompt_overrides(self.match_overrides([sentence])[sentence])
+        text = self.overrides_text(overrides)
+        key = self._fact_key(self.fact_prompt_hash, sentence, ctx, text)
+        try:
+            return self._cached_call("fact", "FactAuditSignature", key,
+                                     lambda: self.bot.audit_fact(sentence=sentence, context=ctx, overrides=text), trace,
+                                     self.base_prompt_tokens["fact"] + approx_tokens(sentence) + approx_tokens(ctx)
+                                     + approx_tokens(text) + COMPLETION_TOKENS["fact"])
+        except Exception as e:
+            trace.error("fact", e)
+            raise
+
+    def run_fact_batch(self, items, trace=None):
+        """
+        Fact-checks [(sentence, ctx, override indices)] from one paragraph in a single
+        call, with the union of their overrides. Returns a list of Predictions aligned with
+        `items`, or None if the reply is malformed or the call fails; the caller then
+        re-checks each sentence on its own.
+        """
+        trace = trace or AuditTrace()
+        keys = [self._fact_key(self.batch_prompt_hash, s, c, self.overrides_text(o)) for s, c, o in items]
+        cached = [self.cache.get_json("fact", k) if self.cache else None for k in keys]
+        if self.cache:
+            for c in cached: trace.cache_lookup("fact", bool(c))
+        preds = [dspy.Prediction(**c) if c else None for c in cached]
+        missing = [i for i, p in enumerate(preds) if p is None]
+        if not missing: return preds
+        text = self.overrides_text(tuple(sorted({o for i in missing for o in items[i][2]})))
+        tokens = (self.base_prompt_tokens["fact_batch"] + approx_tokens(text)
+                  + sum(approx_tokens(items[i][0]) + approx_tokens(items[i][1]) for i in missing)
+                  + min(LLM_MAX_TOKENS, COMPLETION_TOKENS["fact"] + COMPLETION_TOKENS["fact_batch_sentence"] * (len(missing) - 1)))
+        try:
+            out = self._lm_call("BatchFactAuditSignature", lambda: self.bot.audit_fact_batch(
+                [items[i][0] for i in missing], [items[i][1] for i in missing], text), trace,
+                content_key("fact_batch", [keys[i] for i in missing]), tokens)
+            verdicts = parse_verdicts(out.verdicts, len(missing))
+        except Exception as e:
+            trace.error("fact_batch", e)
+            return None
+        if verdicts is None:
+            trace.count("fact_batch_malformed")
+            return None
+        for i, v in zip(missing, verdicts):
+            preds[i] = dspy.Prediction(**v)
+            if self.cache: self.cache.put_json("fact", keys[i], v)
+        return preds
+
+
+    # --- pipeline ---
+    def plan(self, html, target_kw, previous=None, trace=None):
+        """
+        Walks the parsed document once, queueing every finding in document order and
+        collecting the LLM checks behind them as deduplicated work units. Nothing is
+        called yet; hand the plan to `execute` (or iterate `audit()`, which does both).
+        """
+        t_start = time.perf_counter()
+        trace = trace or AuditTrace()
+        dispatcher = OrderedDispatcher(self.concurrency, pool=self.executor)
+        plan = AuditPlan(dispatcher, self.memo_version, trace)
+
+        def emit(stream, label, status, header, quote=""):
+            dispatcher.emit(stream, {"stream": stream, "label": label, "status": status, "header": header, "quote": quote})
+
+        # --- INCREMENTAL MEMO ---
+        # LLM results are remembered per block (tag + text). On re-audit, unchanged blocks reuse them.
+        prev_blocks = {}
+        if previous and previous.get("version") == self.memo_version:
+            prev_blocks = previous["blocks"]
+        new_blocks = plan.memo["blocks"]
+        reuse = plan.reuse
+
+        def remember(block_key, slot, fut, is_clean):
+            def store(done):
+                if not done.cancelled() and done.exception() is None and is_clean(done.result()):
+                    new_blocks.setdefault(block_key, {})[slot] = done.result()
+            fut.add_done_callback(store)
+            return fut
+
+        def unit_for(units, kind, text, block_key):
+            # Repeated text (boilerplate CTAs, identical bullets) shares one unit and one call.
+            unit = units.get(text)
+            if unit is None: unit = units[text] = WorkUnit(kind, text, block_key, dispatcher.defer())
+            unit.uses += 1
+            return unit.future
+
+        def structure_slot(block_key, text):
+            if "structure" in prev_blocks.get(block_key, {}):
+                reuse["checks"] += 1
+                result = new_blocks.setdefault(block_key, {})["structure"] = prev_blocks[block_key]["structure"]
+                return dispatcher.resolved(result)
+            fut = unit_for(plan.structure_units, "structure", text, block_key)
+            return remember(block_key, "structure", fut, lambda pred: pred is not None)
+
+        def fact_slot(block_key, sent):
+            slot = ("fact", sent)
+            if slot in prev_blocks.get(block_key, {}):
+                reuse["checks"] += 1
+                result = new_blocks.setdefault(block_key, {})[slot] = prev_blocks[block_key][slot]
+                return dispatcher.resolved(result)
+            fut = unit_for(plan.fact_units, "fact", sent, block_key)
+            return remember(block_key, slot, fut, lambda result: result[1] is None)
+
+        # --- PARSING ---
+        with trace.stage("parse"):
+            soup = BeautifulSoup(html, HTML_PARSER)
+            blocks = extract_blocks(soup)
+            links = soup.find_all('a')
+
+        # Fallback for plain text
+        if len(blocks) < 1:
+            raw_text = soup.get_text(separator="\n")
+            blocks = [Block("p", b.strip(), None) for b in raw_text.split('\n') if len(b.strip()) > 5]
+
+        # --- 1. GLOBAL CHECKS (LINKS) ---
+        link_count = len(links)
+        if link_count > 4:
+            emit("structure", "SEO | LINK COUNT", "FAIL", f"Link Count: {link_count} (Limit is 4)", "Too many links.")
+        elif link_count == 0:
+            emit("structure", "SEO | LINK COUNT", "FAIL", "Link Count: 0 (Min 2 required)", "No links found.")
+        else:
+            emit("structure", "SEO | LINK COUNT", "PASS", f"Found {link_count} links (Pass)", "OK.")
+
+        # --- 2. MAIN LOOP ---
+        # Blocks never overlap, so every word counts once towards its H2 section.
+        current_section_words = 0
+        current_h2 = None
+        h2_keyword_found = False
+        para_counter = 0
+
+        for block in blocks:
+            tag = block.tag
+
+            # --- STRUCTURE: LIST CONTAINERS ---
+            # Their text is audited through their items.
+            if tag in LIST_TAGS:
+                count = block.items
+                if count > 0 and count < 3:
+                    emit("structure", "LIST CHUNKING", "WARN", f"List has only {count} items.", "Fewer than 3 items lacks meaningful structure.")
+                elif count > 5:
+                    emit("structure", "LIST CHUNKING", "FAIL", f"List has {count} items (Limit is 5).", "Exceeds working-memory span.")
+                continue
+
+            text = block.text.strip()
+            if not text or len(text) < 2: continue
+
+            words = text.split()
+            is_header = tag in HEADING_TAGS
+            # Split once; the paragraph checks and the facts loop share it.
+            sentences = [text] if is_header else split_sentences(text)
+            block_key = content_key(tag, text)
+            new_blocks.setdefault(block_key, {})
+            if block_key in prev_blocks: reuse["blocks"] += 1
+            else: reuse["changed"] += 1
+
+            # --- STRUCTURE: H1 ---
+            if tag == 'h1':
+                if target_kw and target_kw.lower() in text.lower():
+                    emit("structure", "H1 HEADER", "PASS", f"Includes keyword '{target_kw}'", text)
+                else:
+                    emit("structure", "H1 HEADER", "FAIL", f"Missing keyword '{target_kw}'", text)
+
+            # --- STRUCTURE: H2 ---
+            elif tag == 'h2':
+                if current_h2 and current_section_words > 300:
+                    emit("structure", "H2 SECTION LENGTH", "FAIL", f"Section '{current_h2[:30]}...' is {current_section_words} words. Limit is 300.")
+
+                current_section_words = 0
+                current_h2 = text
+                if target_kw and target_kw.lower() in text.lower():
+                    h2_keyword_found = True
+
+            # --- STRUCTURE: LIST ITEMS ---
+            elif tag == 'li':
+                current_section_words += len(words)
+                if len(words) > 30:
+                    emit("structure", "BULLET LENGTH", "FAIL", f"Bullet is {len(words)} words (Limit 30).", text[:50]+"...")
+
+                if len(words) > 5:
+                    def render_bullet(pred, text=text):
+                        if pred is None or pred.status != "FAIL": return []
+                        return [{"stream": "structure", "label": "BULLET CONTEXT", "status": "FAIL", "header": "Bullet not self-contained", "quote": text[:50]+"..."}]
+                    dispatcher.emit_pending("structure", structure_slot(block_key, text), render_bullet)
+
+            # --- STRUCTURE: PARAGRAPHS ---
+            elif tag in ['p', 'div', 'h3', 'h4', 'h5', 'h6']:
+                current_section_words += len(words)
+
+                if len(words) > 5:
+                    para_counter += 1
+                    para_sentences = split_sentences(text) if is_header else sentences
+
+                    if para_counter == 1:
+                        if target_kw and target_kw.lower() in para_sentences[0].lower():
+                            emit("structure", "FIRST SENTENCE", "PASS", f"Keyword '{target_kw}' found.", text[:100])
+                        else:
+                            emit("structure", "FIRST SENTENCE", "FAIL", f"Keyword '{target_kw}' missing.", text[:100])
+
+                    if len(para_sentences) > 4:
+                        emit("structure", "PARAGRAPH LENGTH", "FAIL", f"Too Long ({len(para_sentences)} sentences)", text[:50]+"...")
+                    elif len(words) > 80:
+                        emit("structure", "PARAGRAPH LENGTH", "FAIL", f"Wall of Text ({len(words)} words)", text[:50]+"...")
+                    elif len(para_sentences) < 2 and len(words) > 20:
+                        emit("structure", "PARAGRAPH LENGTH", "WARN", f"Too Short ({len(para_sentences)} sentence - Aim for 2-4)", text[:50]+"...")
+
+                    def render_aeo(pred, text=text):
+                        if pred is None: return []
+                        return [{"stream": "structure", "label": "AEO CHUNKING", "status": pred.status, "header": pred.reason, "quote": text[:50]+"..."}]
+                    dispatcher.emit_pending("structure", structure_slot(block_key, text), render_aeo)
+
+            # --- FACTS & GRAMMAR LOOP ---
+            for sent in sentences:
+                # 1. LARRY RULES
+                rule_hits = self.rule_matcher.match(sent)
+                for hit in rule_hits:
+                    emit("facts", "LARRY RULE", "FAIL", hit.rule['message'], sent)
+                if rule_hits: continue
+
+                # 2. GRAMMAR
+                if not is_header:
+                    style_flags = check_grammar_and_style(sent)
+                    if style_flags:
+                        emit("facts", "STYLE", "WARN", ", ".join(style_flags), sent)
+
+                    # 3. DSPy FACT
+                    def render_fact(result, sent=sent):
+                        pred, emb_error, (route, route_reason) = result
+                        found = []
+                        if emb_error:
+                            found.append({"stream": "facts", "label": "EMBEDDING", "status": "WARN", "header": f"Embedding failed, {self.retriever.embedding_failure} ({emb_error})", "quote": sent})
+                        found.append({"stream": "facts", "label": "FACT/STYLE", "status": pred.status, "header": pred.reason, "quote": sent, "route": route, "route_reason": route_reason})
+                        return found
+                    dispatcher.emit_pending("facts", fact_slot(block_key, sent), render_fact)
+
+        # --- FINAL CHECKS ---
+        if current_h2 and current_section_words > 300:
+            emit("structure", "H2 SECTION LENGTH", "FAIL", f"Section '{current_h2[:30]}...' is {current_section_words} words. Limit is 300.")
+
+        if target_kw:
+            if h2_keyword_found:
+                emit("structure", "H2 KEYWORDS", "PASS", "Primary keyword found in at least one H2.")
+            else:
+                emit("structure", "H2 KEYWORDS", "FAIL", f"Primary keyword '{target_kw}' NOT found in any H2.")
+
+        # Sentences first seen in the same paragraph go out together, at most fact_batch_size per call.
+        for unit in plan.fact_units.values():
+            group = plan.fact_groups[-1] if plan.fact_groups else None
+            if group and group[0].block_key == unit.block_key and len(group) < self.fact_batch_size: group.append(unit)
+            else: plan.fact_groups.append([unit])
+
+        plan.estimate = self.estimate(plan)
+        trace.add_time("plan", time.perf_counter() - t_start - trace.stages["parse"])
+        trace.count("blocks", len(blocks))
+        return plan
+
+    def estimate(self, plan):
+        """
+        Approximate LLM calls and tokens for `plan`. An upper bound: results already in
+        the audit cache, and sentences the cascade pre-screen will settle without a call
+        (known only after retrieval), are counted as if they still needed one.
+        """
+        struct_prompt, fact_prompt, batch_prompt = (self.base_prompt_tokens[k] for k in ("structure", "fact", "fact_batch"))
+        prompt = completion = 0
+        for unit in plan.structure_units.values():
+            prompt += struct_prompt + approx_tokens(unit.text)
+            completion += COMPLETION_TOKENS["structure"]
+        for group in plan.fact_groups:
+            prompt += (fact_prompt if len(group) == 1 else batch_prompt) + self.overrides_tokens
+            prompt += sum(approx_tokens(u.text) + self.context_tokens for u in group)
+            completion += min(LLM_MAX_TOKENS, COMPLETION_TOKENS["fact"] + COMPLETION_TOKENS["fact_batch_sentence"] * (len(group) - 1))
+
+        price = LLM_PRICE_PER_MTOK.get(self.llm_model)
+        return {
+            "llm_calls": len(plan.structure_units) + len(plan.fact_groups),
+            "structure_calls": len(plan.structure_units),
+            "fact_calls": len(plan.fact_groups),
+            "embeddings": len(plan.fact_units) if self._embeds_for_retrieval() else 0,
+            "checks": plan.reuse["checks"] + sum(u.uses for u in list(plan.structure_units.values()) + list(plan.fact_units.values())),
+            "duplicates": plan.duplicates,
+            "reused": plan.reuse["checks"],
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "cost_usd": (prompt * price[0] + completion * price[1]) / 1e6 if price else None,
+        }
+
+    def execute(self, plan, on_progress=None):
+        """Runs each work unit of `plan` once and yields its findings in order as calls complete."""
+        progress = on_progress or (lambda done, total, message: None)
+        dispatcher, trace = plan.dispatcher, plan.trace
+
+        # Structure checks need nothing else, so they start while sentences are embedded.
+        for unit in plan.structure_units.values():
+            dispatcher.bind(unit.future, self.run_structure_check, unit.text, trace)
+
+        # Dense and hybrid retrieval embed every unique fact-check sentence in batched requests first.
+        embeddings, emb_errors = {}, {}
+        if plan.fact_units and self._embeds_for_retrieval():
+            progress(0, len(dispatcher.futures), f"Embedding {len(plan.fact_units)} sentences...")
+            with trace.stage("embed"):
+                embeddings, emb_errors = self.embed_texts(list(plan.fact_units), trace)
+        with trace.stage("retrieve"):
+            matches = self.retriever.retrieve_scored(list(plan.fact_units), embeddings)
+            override_matches = self.match_overrides(list(plan.fact_units))
+        contexts = {s: ctx for s, (ctx, _) in matches.items()}
+        prompt_overrides = {s: self.prompt_overrides(m) for s, m in override_matches.items()}
+        def fact_job(sent):
+            return (self.run_fact_check(sent, contexts.get(sent, NO_CONTEXT), trace, prompt_overrides[sent]),
+                    emb_errors.get(sent), plan.routing[sent])
+        def fact_batch_job(sents):
+            preds = self.run_fact_batch([(s, contexts.get(s, NO_CONTEXT), prompt_overrides[s]) for s in sents], trace)
+            return None if preds is None else [(p, emb_errors.get(s), plan.routing[s]) for p, s in zip(preds, sents)]
+        def fallback(placeholder, sent):
+            trace.count("fact_batch_fallbacks")
+            dispatcher.bind(placeholder, fact_job, sent)
+
+        # Cascade: screened sentences are settled here; the rest keep their batch grouping.
+        with trace.stage("screen"):
+            plan.routing = self.route_facts(list(plan.fact_units), {s: score for s, (_, score) in matches.items()}, override_matches)
+            for unit in plan.fact_units.values():
+                if plan.routing[unit.text][0] == "screened":
+                    unit.future.set_result((self.bot.screened_verdict(unit.text), emb_errors.get(unit.text), plan.routing[unit.text]))
+        trace.count("screened", sum(1 for route, _ in plan.routing.values() if route == "screened"))
+        groups = [[u for u in group if plan.routing[u.text][0] == "full"] for group in plan.fact_groups]
+
+        # A malformed batch reply falls back to one call per sentence.
+        for group in filter(None, groups):
+            if len(group) == 1:
+                dispatcher.bind(group[0].future, fact_job, group[0].text)
+                continue
+            sents, placeholders = [u.text for u in group], [u.future for u in group]
+            dispatcher.bind_batch(placeholders, fact_batch_job, sents,
+                                  fallback=lambda i, sents=sents, placeholders=placeholders: fallback(placeholders[i], sents[i]))
+
+        # Progress follows completed LLM calls, not the element index. Time spent by the
+        # caller between findings (rendering) is not counted as waiting.
+        waited = time.perf_counter()
+        for _, finding in dispatcher.drain(lambda done, total: progress(done, total, f"Completed {done}/{total} checks...")):
+            trace.add_time("llm_wait", time.perf_counter() - waited)
+            yield finding
+            waited = time.perf_counter()
+        trace.add_time("llm_wait", time.perf_counter() - waited)
+        trace.finish()
+
+    def _run(self, run):
+        plan = run.plan = self.plan(run.html, run.target_kw, run.previous, run.trace)
+        run.reuse = plan.reuse
+        if run.on_plan: run.on_plan(plan)
+        yield from self.execute(plan, run.on_progress)
+        run.memo = plan.memo
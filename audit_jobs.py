@@ -0,0 +1,217 @@
+"""
+Background audit jobs.
+
+Audits are submitted to a JobRunner and run on its worker threads. Progress and
+findings are written to a JobStore (a SQLite file beside the audit cache) in small
+batches as they arrive. Any session can look a job up by ID and read the findings
+written so far. A widget change, a reload or a second tab therefore reattaches to
+the job instead of losing the work, and one person's audit doesn't block anyone
+else's session.
+
+    queued -> running -> done | failed | cancelled
+
+Jobs still queued or running when the process stopped are marked failed
+("interrupted") the next time a runner starts. Block memos for incremental re-audits
+stay in memory, for the most recent jobs only.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED = {"done", "failed", "cancelled"}
+FLUSH_FINDINGS = 25       # findings buffered before a write
+FLUSH_SECONDS = 0.5       # ...or this long since the last write
+KEEP_MEMOS = 32           # block memos kept for incremental re-audits
+JOB_COLUMNS = ("keyword", "status", "created", "started", "finished", "done", "total", "message", "error", "summary", "trace")
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, keyword TEXT NOT NULL, html TEXT NOT NULL, status TEXT NOT NULL,"
+            " created REAL NOT NULL, started REAL, finished REAL, done INTEGER NOT NULL DEFAULT 0,"
+            " total INTEGER NOT NULL DEFAULT 0, message TEXT NOT NULL DEFAULT '', error TEXT,"
+            " summary TEXT, trace TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS findings ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, finding TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+
+    def create(self, keyword, html):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._db.execute("INSERT INTO jobs(id, keyword, html, status, created) VALUES (?,?,?,?,?)",
+                             (job_id, keyword, html, "queued", time.time()))
+        return job_id
+
+    def update(self, job_id, **fields):
+        """Sets job columns; `summary` and `trace` are stored as JSON."""
+        for name in ("summary", "trace"):
+            if name in fields: fields[name] = json.dumps(fields[name])
+        bad = set(fields) - set(JOB_COLUMNS)
+        if bad: raise ValueError(f"Unknown job field(s): {', '.join(sorted(bad))}")
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {', '.join(f'{k}=?' for k in fields)} WHERE id=?", (*fields.values(), job_id))
+
+    def add_findings(self, job_id, first_seq, findings):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO findings(job_id, seq, finding) VALUES (?,?,?)",
+                                 [(job_id, first_seq + i, json.dumps(f)) for i, f in enumerate(findings)])
+            self._db.execute("COMMIT")
+
+    def job(self, job_id):
+        """The job's row as a dict (without its HTML), or None for an unknown ID."""
+        with self._lock:
+            cur = self._db.execute(f"SELECT id, {', '.join(JOB_COLUMNS)} FROM jobs WHERE id=?", (job_id,))
+            row = cur.fetchone()
+        if row is None: return None
+        job = dict(zip(("id",) + JOB_COLUMNS, row))
+        for name in ("summary", "trace"):
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def html(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT html FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def findings(self, job_id, after=-1):
+        """[(seq, finding)] written for the job after sequence number `after`."""
+        with self._lock:
+            rows = self._db.execute("SELECT seq, finding FROM findings WHERE job_id=? AND seq>? ORDER BY seq",
+                                    (job_id, after)).fetchall()
+        return [(seq, json.loads(f)) for seq, f in rows]
+
+    def recent(self, limit=10):
+        """Newest jobs first: [{id, keyword, status, created, finished, done, total}]."""
+        with self._lock:
+            rows = self._db.execute("SELECT id, keyword, status, created, finished, done, total FROM jobs"
+                                    " ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("id", "keyword", "status", "created", "finished", "done", "total"), r)) for r in rows]
+
+    def interrupt_unfinished(self):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status='failed', error='interrupted (the app restarted)', finished=?"
+                             " WHERE status IN ('queued', 'running')", (time.time(),))
+
+    def prune(self, max_age_days=30):
+        """Deletes finished jobs (and their findings) older than `max_age_days`."""
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM findings WHERE job_id IN (SELECT id FROM jobs WHERE created<? AND status IN ('done', 'failed', 'cancelled'))", (cutoff,))
+            self._db.execute("DELETE FROM jobs WHERE created<? AND status IN ('done', 'failed', 'cancelled')", (cutoff,))
+            self._db.execute("COMMIT")
+
+
+class _JobWriter:
+    # Buffers one job's findings and progress so the store sees a write every few
+    # findings or FLUSH_SECONDS, not one per LLM call.
+    def __init__(self, store, job_id):
+        self.store, self.job_id = store, job_id
+        self.pending, self.seq = [], 0
+        self.progress = None
+        self.last = time.monotonic()
+
+    def add(self, finding):
+        self.pending.append(finding)
+        if len(self.pending) >= FLUSH_FINDINGS: self.flush()
+        else: self.maybe_flush()
+
+    def on_progress(self, done, total, message):
+        self.progress = (done, total, message)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last >= FLUSH_SECONDS: self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.store.add_findings(self.job_id, self.seq, self.pending)
+            self.seq += len(self.pending)
+            self.pending = []
+        if self.progress:
+            done, total, message = self.progress
+            self.store.update(self.job_id, done=done, total=total, message=message)
+            self.progress = None
+        self.last = time.monotonic()
+
+
+class JobRunner:
+    """
+    Runs audits on `engine` in up to `max_jobs` background threads (each audit still
+    bounds its own LLM calls by the engine's concurrency) and records them in `store`.
+    """
+    def __init__(self, engine, store, max_jobs=4):
+        self.engine = engine
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_jobs), thread_name_prefix="audit-job")
+        self._lock = threading.Lock()
+        self._cancelled = set()
+        self._memos = OrderedDict()
+        store.interrupt_unfinished()
+
+    def submit(self, html, keyword, previous=None):
+        """Queues an audit and returns its job ID. `previous` is a block memo, as for AuditEngine.audit."""
+        job_id = self.store.create(keyword, html)
+        self.executor.submit(self._run, job_id, html, keyword, previous)
+        return job_id
+
+    def cancel(self, job_id):
+        with self._lock: self._cancelled.add(job_id)
+
+    def memo(self, job_id):
+        """Block memo of a finished job from this process, for an incremental re-audit (or None)."""
+        with self._lock: return self._memos.get(job_id)
+
+    def _is_cancelled(self, job_id):
+        with self._lock: return job_id in self._cancelled
+
+    def _run(self, job_id, html, keyword, previous):
+        store = self.store
+        if self._is_cancelled(job_id):
+            store.update(job_id, status="cancelled", finished=time.time())
+            return
+        store.update(job_id, status="running", started=time.time(), message="Planning...")
+        writer = _JobWriter(store, job_id)
+        summary = {"incremental": previous is not None}
+        run = None
+        try:
+            def on_plan(plan):
+                summary["plan"] = plan.summary()
+                store.update(job_id, summary=summary, total=len(plan.dispatcher.futures))
+            run = self.engine.audit(html, keyword, previous=previous, on_progress=writer.on_progress, on_plan=on_plan)
+            for finding in run:
+                writer.add(finding)
+                if self._is_cancelled(job_id): break
+            writer.flush()
+            if self._is_cancelled(job_id):
+                store.update(job_id, status="cancelled", finished=time.time(), message="Cancelled.", trace=run.trace.to_dict())
+                return
+            with self._lock:
+                self._memos[job_id] = run.memo
+                while len(self._memos) > KEEP_MEMOS: self._memos.popitem(last=False)
+            summary.update(reuse=run.reuse, routed=len(run.plan.routing),
+                           screened=sum(1 for route, _ in run.plan.routing.values() if route == "screened"))
+            store.update(job_id, status="done", finished=time.time(), message="Audit complete.",
+                         summary=summary, trace=run.trace.to_dict())
+        except Exception as e:
+            writer.flush()
+            # The trace up to the failure is what the diagnostics panel needs most.
+            store.update(job_id, status="failed", finished=time.time(), error=f"{type(e).__name__}: {e}",
+                         trace=run.trace.to_dict() if run is not None else None)
+        finally:
+            with self._lock: self._cancelled.discard(job_id)
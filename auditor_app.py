@@ -1,16 +1,12 @@
 import streamlit as st
-import dspy # pip install dspy-ai
 import os
 import json
-import numpy as np
 import base64
 import re
 import time
-import uuid 
-from bs4 import BeautifulSoup
-from sklearn.metrics.pairwise import cosine_similarity
-from streamlit_quill import st_quill
-from openai import OpenAI
+from warmup import FIRST_PAINT_BUDGET_MS, audit_warmup
+
+SCRIPT_STARTED = time.perf_counter()
 
 # --- 0. CONFIG & AUTHENTICATION ---
 st.set_page_config(
@@ -33,6 +29,18 @@ CORE_CSS = """
 """
 st.markdown(f"<style>{CORE_CSS}</style>", unsafe_allow_html=True)
 
+# --- 2. PATHS & ASSETS ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGO_PATH = os.path.join(BASE_DIR, "ipostal1_logo.png")
+CACHE_PATH = os.path.join(BASE_DIR, ".audit_cache.sqlite3")
+JOBS_PATH = os.path.join(BASE_DIR, ".audit_jobs.sqlite3")
+LLM_BUDGET_PATH = os.path.join(BASE_DIR, ".audit_llm_budget.sqlite3")
+
+# --- WARM-UP ---
+# Everything an audit needs loads on a background thread, once per process (see warmup.py).
+# serve.py starts it with the process; otherwise this first page load does.
+warmup = audit_warmup()
+
 # --- LOGIN ---
 if "OPENAI_API_KEY" not in st.secrets or "APP_PASSWORD" not in st.secrets:
     st.error("❌ Missing .streamlit/secrets.toml file.")
@@ -51,20 +59,42 @@ def check_login():
             st.rerun()
         else:
             st.error("Incorrect Password")
+    warmup.record_first_paint((time.perf_counter() - SCRIPT_STARTED) * 1000)
     return False
 
 if not check_login(): st.stop()
 
 # --- 1. DSPY SETUP ---
+if not warmup.ready:
+    try:
+        with st.spinner("Loading the auditor..."): warmup.result("data")
+    except Exception as e:
+        # The next page load starts a fresh warm-up (see audit_warmup).
+        st.error(f"❌ The auditor failed to load: {e}. Reload the page to retry.")
+        st.stop()
+
+# Already imported by the warm-up thread, so these are dictionary lookups by now.
+import dspy # pip install dspy-ai
+from streamlit_quill import st_quill
+from openai import OpenAI
+from audit_cache import AuditCache
+from audit_jobs import FINISHED, JobRunner, JobStore
+from audit_engine import AuditEngine, LLM_MAX_TOKENS, LLM_MODEL, OVERRIDES_TOP_K
+from llm_gateway import LLMGateway, SharedBudget
+from embeddings import get_embedder
+from reports import REPORT_FORMATS, STATUS_CSS, render_report
+from retrieval import DEFAULT_THRESHOLD, DEFAULT_TOP_K, get_retriever
+
 api_key = st.secrets["OPENAI_API_KEY"]
 
 @st.cache_resource
 def get_llm_object(key):
     try:
-        return dspy.LM('openai/gpt-4o', api_key=key, max_tokens=300)
-    except:
+        # Retries are the gateway's job (see get_llm_gateway), so every caller sees the same backoff.
+        return dspy.LM(LLM_MODEL, api_key=key, max_tokens=LLM_MAX_TOKENS, num_retries=0)
+    except Exception:
         try:
-            return dspy.OpenAI(model='gpt-4o', api_key=key, max_tokens=300)
+            return dspy.OpenAI(model=LLM_MODEL.split('/')[-1], api_key=key, max_tokens=LLM_MAX_TOKENS)
         except Exception as e:
             st.error(f"❌ OpenAI Connection Error: {e}")
             return None
@@ -72,60 +102,27 @@ def get_llm_object(key):
 lm_object = get_llm_object(api_key)
 if not lm_object: st.stop()
 
-# --- 2. PATHS & ASSETS ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-LOGO_PATH = os.path.join(BASE_DIR, "ipostal1_logo.png")
-KB_PATH = os.path.join(BASE_DIR, "ipostal1_knowledge_base.json")
-RULES_PATH = os.path.join(BASE_DIR, "larry_rules.json")
-OVERRIDES_PATH = os.path.join(BASE_DIR, "overrides.json")
-
-# --- 3. DSPY SIGNATURES ---
-class FactAuditSignature(dspy.Signature):
-    """
-    ROLE: Senior Content Auditor for iPostal1.
-    INSTRUCTIONS:
-    1. CHECK DEFINITION TRAP (Highest Priority):
-       - Does this sentence define "A Virtual Address" (universal) as HAVING digital features?
-       - FAIL PATTERN: "A virtual address is a location managed via an app."
-       - PASS PATTERN: "An iPostal1 virtual address includes an app."
-    2. CHECK OVERRIDES: If the claim contradicts the Overrides list -> FAIL.
-    3. CHECK TERMINOLOGY: "P.O. Box" refers to a competitor. Claims stating they lack features are TRUE.
-    4. CHECK PASSIVE VOICE: FAIL only if structure is truly passive.
-    5. CHECK OPERATIONAL DETAILS: Claims about LOGGING, PHOTOGRAPHING, or SCANNING THE EXTERIOR of mail are TRUE standard procedures.
-    
-    OUTPUT: PASS, FAIL, or WARN.
-    """
-    sentence = dspy.InputField()
-    context = dspy.InputField(desc="Knowledge Base")
-    overrides = dspy.InputField(desc="Overrides List")
-    status = dspy.OutputField(desc="PASS, FAIL, or WARN")
-    reason = dspy.OutputField(desc="Reason")
-
-class StructureAuditSignature(dspy.Signature):
-    """
-    TASK: Audit this text block for AEO Structure (Chunking).
-    RULES:
-    1. SINGLE IDEA: Does it focus on ONE concept?
-    2. SELF-CONTAINED: Can it be understood in isolation?
-    OUTPUT: PASS or FAIL
-    """
-    paragraph = dspy.InputField()
-    status = dspy.OutputField(desc="PASS or FAIL")
-    reason = dspy.OutputField(desc="Reason")
-
-class AuditorBot(dspy.Module):
-    def __init__(self):
-        super().__init__()
-        self.fact_check = dspy.ChainOfThought(FactAuditSignature)
-        self.struct_check = dspy.ChainOfThought(StructureAuditSignature)
-
-    def audit_fact(self, sentence, context, overrides):
-        return self.fact_check(sentence=sentence, context=context, overrides=overrides)
-
-    def audit_structure(self, paragraph):
-        return self.struct_check(paragraph=paragraph)
-
-bot = AuditorBot()
+# Max number of LLM round trips in flight at once during an audit.
+AUDIT_CONCURRENCY = int(st.secrets.get("AUDIT_CONCURRENCY", 8))
+# Sentences of one paragraph fact-checked per LLM call (1 = one call per sentence).
+AUDIT_FACT_BATCH = int(st.secrets.get("AUDIT_FACT_BATCH", 4))
+# KB retrieval: "dense" (embeddings), "lexical" (in-process BM25, no API calls) or "hybrid".
+AUDIT_RETRIEVAL = st.secrets.get("AUDIT_RETRIEVAL", "dense")
+# Pre-screen fact checks: sentences with no checkable claim and no KB/overrides match skip the LLM.
+AUDIT_CASCADE = bool(st.secrets.get("AUDIT_CASCADE", True))
+AUDIT_CASCADE_KB_SCORE = st.secrets.get("AUDIT_CASCADE_KB_SCORE")   # default: audit_engine.CASCADE_KB_SCORE
+AUDIT_RETRIEVAL_TOP_K = int(st.secrets.get("AUDIT_RETRIEVAL_TOP_K", DEFAULT_TOP_K))
+AUDIT_RETRIEVAL_THRESHOLD = float(st.secrets.get("AUDIT_RETRIEVAL_THRESHOLD", DEFAULT_THRESHOLD))
+# Overrides sent with each fact check besides the always-on ones, once the list is long (0 = the whole list every time).
+AUDIT_OVERRIDES_TOP_K = int(st.secrets.get("AUDIT_OVERRIDES_TOP_K", OVERRIDES_TOP_K))
+# LLM budgets shared by every session and by batch audits on this machine (unset = no limit; 429s are still retried).
+AUDIT_LLM_RPM = st.secrets.get("AUDIT_LLM_RPM")
+AUDIT_LLM_TPM = st.secrets.get("AUDIT_LLM_TPM")
+# Audits running at once in the background, across all sessions (each still capped by AUDIT_CONCURRENCY).
+AUDIT_MAX_JOBS = int(st.secrets.get("AUDIT_MAX_JOBS", 4))
+JOB_RETENTION_DAYS = 30
+JOB_POLL_SECONDS = 1.0
+JOB_LIST_SIZE = 8
 
 # --- 4. HELPERS ---
 def get_base64_logo(file_path):
@@ -133,109 +130,230 @@ def get_base64_logo(file_path):
     with open(file_path, "rb") as f: return base64.b64encode(f.read()).decode()
 logo_b64 = get_base64_logo(LOGO_PATH)
 
+kb_index, larry_rules, overrides, kb_error = warmup.result("data")
+facts = kb_index.facts
+
 @st.cache_resource
-def load_data():
-    kb, vecs, rules, ovr = [], None, [], []
-    if os.path.exists(KB_PATH):
-        try:
-            with open(KB_PATH, 'r') as f: data = json.load(f)
-            kb = [f"Q: {e.get('question','')} | A: {e.get('answer','')}" for e in data if "embedding" in e]
-            vecs = np.array([e["embedding"] for e in data if "embedding" in e])
-        except: pass
-    if os.path.exists(RULES_PATH): 
-        with open(RULES_PATH, 'r') as f: rules = json.load(f)
-    if os.path.exists(OVERRIDES_PATH):
-        with open(OVERRIDES_PATH, 'r') as f: ovr = json.load(f)
-    return kb, vecs, rules, ovr
-
-facts, vectors, larry_rules, overrides = load_data()
-
-def get_embedding_openai(text):
-    text = text.replace("\n", " ")
-    try:
-        client = OpenAI(api_key=api_key)
-        return client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
-    except: return None
-
-# --- UPDATED SENTENCE SPLITTER ---
-def split_sentences(text):
-    """
-    Splits text into sentences while ignoring periods in common abbreviations (U.S., U.K., Mr., etc.).
-    Strategy:
-    1. Use negative lookbehinds (?<!...) to ignore known abbreviations.
-    2. Use lookahead (?=[A-Z]|$) to only split if the next char is Uppercase or end-of-string.
-       This prevents splitting "U.S. government" where 'g' is lowercase.
-    """
-    # Pattern explanation:
-    # (?<!U\.S) -> Do not split if preceded by U.S
-    # (?<!\b[A-Z]) -> Do not split if preceded by a single capital letter (initials)
-    # [.!?]+ -> Split on punctuation
-    # (?:\s+(?=[A-Z])|$) -> Only if followed by whitespace+Capital Letter OR End of string
-    
-    pattern = r'(?<!U\.S)(?<!U\.K)(?<!P\.O)(?<!Mr)(?<!Mrs)(?<!Ms)(?<!Dr)(?<!Inc)(?<!Ltd)(?<!\b[A-Z])[.!?]+(?:\s+(?=[A-Z])|$)'
-    
-    chunks = re.split(pattern, text)
-    return [c.strip() for c in chunks if len(c.strip()) > 5]
+def get_audit_cache():
+    # Shared by every session in the process; SQLite handles persistence across restarts.
+    return AuditCache(CACHE_PATH, max_bytes=int(st.secrets.get("AUDIT_CACHE_MB", 256)) * 1024 * 1024)
 
-def check_grammar_and_style(sentence):
-    flags = []
-    
-    # --- UPDATED SECTION: REFERENTIAL AMBIGUITY ---
-    # This regex looks for This, That, These, Those, It, or They at the start of a sentence.
-    # It captures the specific word found so you can see which one triggered the flag.
-    ambiguity_match = re.search(r'^\W*(This|That|These|Those|It|They)\b', sentence, re.IGNORECASE)
-    if ambiguity_match:
-        found_word = ambiguity_match.group(1).title() # Capitalize for the label
-        flags.append(f"Referential Ambiguity ('{found_word}' at start)")
-    # -----------------------------------------------
-
-    if sentence.strip().endswith('?') and len(sentence) > 20: flags.append("Rhetorical Question")
-    if re.search(r'\b(imagine|picture this|guess what)\b', sentence, re.IGNORECASE): flags.append("Hype Language")
-    if re.search(r'\b(was|were|is|are|been)\b\s+\w+\s+\bby\b', sentence, re.IGNORECASE): flags.append("Passive Voice (Regex)")
-    return flags
-
-def generate_report(s_logs, f_logs, title, notes, include_pass):
-    html = f"""<html><head><style>{CORE_CSS} body {{ padding: 40px; max-width: 800px; margin: 0 auto; }}</style></head><body>
-    <div style="text-align:center;"><h1>{title}</h1><p>{time.strftime("%Y-%m-%d")}</p></div>
-    {f'<div style="background:#f4f4f4; padding:15px; margin-bottom:20px;"><strong>Notes:</strong><br>{notes}</div>' if notes else ''}"""
-    
-    filtered_s = [r for r in s_logs if include_pass or r['status'] != 'PASS']
-    filtered_f = [r for r in f_logs if include_pass or r['status'] != 'PASS']
-
-    if filtered_s:
-        html += "<h3>SEO and AEO Structure Audit</h3>"
-        for r in filtered_s:
-            if r['status'] == "FAIL": c = "fail-box"
-            elif r['status'] == "WARN": c = "warn-box"
-            else: c = "pass-box"
-            label_html = f"<span class='meta-label'>{r.get('label','')}</span>" if r.get('label') else ""
-            html += f"<div class='{c}'>{label_html}<strong>{r['header']}</strong><br><em>{r['quote']}</em></div>"
-            
-    if filtered_f:
-        html += "<h3>Facts, Grammar, and Style Audit</h3>"
-        for r in filtered_f:
-            if r['status'] == "FAIL": c = "fail-box"
-            elif r['status'] == "WARN": c = "warn-box"
-            else: c = "pass-box"
-            label_html = f"<span class='meta-label'>{r.get('label','')}</span>" if r.get('label') else ""
-            html += f"<div class='{c}'>{label_html}<strong>[{r['status']}] {r['header']}</strong><br><em>{r['quote']}</em></div>"
-            
-    html += "</body></html>"
-    return html
+audit_cache = get_audit_cache()
+
+@st.cache_resource
+def get_openai_client(key):
+    # One long-lived client per process so its HTTP connection pool is reused across audits.
+    return OpenAI(api_key=key, max_retries=2)
+
+@st.cache_resource
+def get_llm_gateway():
+    # One per process: rate budgets, 429 backoff and in-flight coalescing across all sessions. The budgets
+    # are shared with batch_audit.py runs on this machine, whose calls wait while ours are queued.
+    return LLMGateway(rpm=int(AUDIT_LLM_RPM) if AUDIT_LLM_RPM else None, tpm=int(AUDIT_LLM_TPM) if AUDIT_LLM_TPM else None,
+                      shared=SharedBudget(LLM_BUDGET_PATH))
+
+llm_gateway = get_llm_gateway()
+
+@st.cache_resource
+def get_engine(key):
+    # Queries must be embedded with the same backend the KB was built with.
+    embedder = get_embedder(kb_index.embed_model, client=get_openai_client(key))
+    retriever = get_retriever(AUDIT_RETRIEVAL, kb_index, k=AUDIT_RETRIEVAL_TOP_K, threshold=AUDIT_RETRIEVAL_THRESHOLD)
+    return AuditEngine(lm_object, kb_index=kb_index, rules=larry_rules, overrides=overrides,
+                       embedder=embedder, cache=audit_cache, concurrency=AUDIT_CONCURRENCY,
+                       fact_batch_size=AUDIT_FACT_BATCH, retriever=retriever, cascade=AUDIT_CASCADE,
+                       cascade_kb_score=None if AUDIT_CASCADE_KB_SCORE is None else float(AUDIT_CASCADE_KB_SCORE),
+                       gateway=llm_gateway, priority="interactive", overrides_top_k=AUDIT_OVERRIDES_TOP_K,
+                       kb_error=kb_error)
+
+engine = get_engine(api_key)
+
+@st.cache_resource
+def get_job_runner(key):
+    # One runner per process: audits from every session share its workers and job store.
+    store = JobStore(JOBS_PATH)
+    store.prune(JOB_RETENTION_DAYS)
+    return JobRunner(get_engine(key), store, max_jobs=AUDIT_MAX_JOBS)
+
+runner = get_job_runner(api_key)
+
+# --- CARDS ---
+STATUS_ICON = {"FAIL": "❌", "WARN": "⚠️", "PASS": "✅"}
+LABELLED_CARDS = {"LIST CHUNKING", "BULLET LENGTH", "BULLET CONTEXT", "AEO CHUNKING", "EMBEDDING", "FACT/STYLE"}
+ICON_CARDS = {"LARRY RULE", "STYLE", "EMBEDDING", "FACT/STYLE"}
+HEADER_ONLY_CARDS = {"SEO | LINK COUNT", "H2 SECTION LENGTH", "H2 KEYWORDS"}
+EXPORT_SECTIONS = {"structure": "SEO and AEO Structure", "facts": "Facts, Grammar, and Style"}
+EXPORT_PAGE_SIZES = [25, 50, 100]
+NO_LABEL = "(no label)"
+JOB_ICON = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌", "cancelled": "✖"}
+
+def render_card(item):
+    label = item.get('label', '')
+    label_html = f"<span class='meta-label'>{label}</span>" if label in LABELLED_CARDS else ""
+    icon = f"{STATUS_ICON.get(item['status'], '')} " if label in ICON_CARDS else ""
+    quote_html = f"<br><em>{item['quote']}</em>" if item.get('quote') and label not in HEADER_ONLY_CARDS else ""
+    return f"<div class='{STATUS_CSS.get(item['status'], 'pass-box')}'>{label_html}<strong>{icon}{item['header']}</strong>{quote_html}</div>"
+
+def generate_report(fmt, title, notes):
+    # The export view reruns on every click; only re-render when the report itself would change.
+    key = (frozenset(st.session_state.selected_ids), title, notes, time.strftime("%Y-%m-%d"))
+    cached = st.session_state.report_memo.get(fmt)
+    if cached and cached[0] == key: return cached[1]
+    s_logs = [item for item in st.session_state.logs["structure"] if item['id'] in key[0]]
+    f_logs = [item for item in st.session_state.logs["facts"] if item['id'] in key[0]]
+    report = render_report(fmt, s_logs, f_logs, title, notes, css=CORE_CSS)
+    st.session_state.report_memo[fmt] = (key, report)
+    return report
+
+def show_cache_stats():
+    c = audit_cache.stats()
+    g = llm_gateway.snapshot()
+    cache_stats_slot.caption(f"🗄️ Cache: {c['hits']} hits / {c['misses']} misses ({c['hit_rate']:.0%} hit rate)  \n"
+                             f"🚦 LLM: {g['calls']} calls, {g['coalesced']} merged, {g['rate_limited']} rate-limited · "
+                             f"{g['window_requests']} req / {g['window_tokens']:,} tok in the last minute")
+
+def md_table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(str(c) for c in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+def show_diagnostics():
+    # Sidebar panel for the last audit's trace (see instrumentation.py), with a JSON download.
+    trace = st.session_state.last_trace
+    if not trace: return
+    with diagnostics_slot.container():
+        with st.expander("🩺 Diagnostics (last audit)"):
+            st.caption(f"Audit {trace['audit_id']} · {trace['wall_seconds']:.1f}s wall · {trace['started']}")
+            st.markdown("**Stages** (seconds, summed across threads)\n\n" + md_table(["stage", "s"], trace["stages"].items()))
+            if trace["llm"]:
+                st.markdown("**LLM calls**\n\n" + md_table(
+                    ["signature", "calls", "fail", "p50 ms", "p90 ms", "tok in", "tok out"],
+                    [(sig.replace("Signature", ""), v["calls"], v["failures"], v["latency_ms"].get("p50"), v["latency_ms"].get("p90"),
+                      v["prompt_tokens"], v["completion_tokens"]) for sig, v in trace["llm"].items()]))
+            if trace["cache"]:
+                st.markdown("**Cache**  " + " · ".join(f"{kind}: {c['hits']}/{c['hits'] + c['misses']} hits" for kind, c in trace["cache"].items()))
+            if trace["counters"]:
+                st.markdown("**Counters**  " + " · ".join(f"{k}: {v}" for k, v in trace["counters"].items()))
+            if trace["errors"]:
+                st.warning(f"{len(trace['errors'])} error(s) during the audit")
+                st.json(trace["errors"], expanded=False)
+            st.download_button("⬇️ Download JSON trace", json.dumps(trace, indent=2), file_name=f"audit-trace-{trace['audit_id']}.json",
+                               mime="application/json", key=f"trace_{trace['audit_id']}")
+
+def attach_job(job_id):
+    # Points this session, and the URL (so a reload reattaches), at a job; its findings are re-read from the start.
+    if job_id == st.session_state.job_id: return
+    st.session_state.job_id = job_id
+    st.session_state.job_cursor = -1
+    st.session_state.job_finalized = False
+    st.session_state.job_render_seconds = 0.0
+    st.session_state.logs = {"structure": [], "facts": []}
+    st.session_state.audit_run = False
+    st.session_state.view_mode = "audit"
+    st.query_params["job"] = job_id
+
+def sync_job_findings(job_id):
+    # Findings written since the last poll; ids are stable, so export selections survive a reattach.
+    for seq, finding in runner.store.findings(job_id, after=st.session_state.job_cursor):
+        stream = finding.pop("stream")
+        st.session_state.logs[stream].append({"id": f"{job_id}-{seq}", **finding})
+        st.session_state.job_cursor = seq
+
+def render_job(job):
+    t0 = time.perf_counter()
+    sync_job_findings(job["id"])
+    summary = job["summary"] or {}
+    if summary.get("plan"): st.caption(f"📋 Plan: {summary['plan']}")
+    if job["status"] not in FINISHED:
+        st.progress(job["done"] / job["total"] if job["total"] else 0.0, text=job["message"] or "Queued...")
+        st.button("✖ Cancel audit", on_click=runner.cancel, args=(job["id"],))
+        st.caption(f"Job `{job['id']}` runs in the background: you can leave this page and reopen it from the sidebar.")
+    for stream, section_title in (("structure", "SEO and AEO Structure Audit"), ("facts", "Facts, Grammar, and Style Audit")):
+        st.subheader(section_title)
+        cards = [render_card(item) for item in st.session_state.logs[stream] if item['status'] != 'PASS' or st.session_state.show_pass]
+        if cards: st.markdown("".join(cards), unsafe_allow_html=True)
+    # Reading and drawing findings is this session's "render" stage in the job's trace (see finalize_job).
+    st.session_state.job_render_seconds += time.perf_counter() - t0
+
+    reuse = summary.get("reuse") or {}
+    if job["status"] == "done":
+        if summary.get("incremental") and reuse.get("checks"):
+            st.caption(f"♻️ {reuse['changed']} changed block(s) re-checked; {reuse['checks']} LLM result(s) reused from {reuse['blocks']} unchanged block(s).")
+        if summary.get("screened"):
+            st.caption(f"🔀 Pre-screen: {summary['screened']} of {summary['routed']} sentence(s) had no checkable claim and skipped the full fact check.")
+        st.success("Audit Complete.")
+    elif job["status"] == "failed":
+        st.error(f"Audit failed: {job['error']}")
+    elif job["status"] == "cancelled":
+        st.warning("Audit cancelled; findings up to that point are shown.")
+
+def finalize_job(job):
+    # Once per job and session: keep its memo for the next incremental audit and its trace for diagnostics,
+    # with the time spent rendering its findings added; the first session to finish watching it stores that.
+    if st.session_state.job_finalized: return False
+    sync_job_findings(job["id"])
+    if job["status"] == "done": st.session_state.block_memo = runner.memo(job["id"])
+    trace = job["trace"]
+    if trace:
+        stored = "render" in trace["stages"]
+        trace["stages"] = dict(sorted({**trace["stages"], "render": round(st.session_state.job_render_seconds, 4)}.items()))
+        if not stored: runner.store.update(job["id"], trace=trace)
+    st.session_state.last_trace = trace
+    st.session_state.audit_run = any(st.session_state.logs.values())
+    st.session_state.job_finalized = True
+    return True
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job(job_id):
+    # Reruns only this fragment while the job runs; a full rerun picks up the finished job.
+    job = runner.store.job(job_id)
+    if job["status"] in FINISHED: st.rerun()
+    render_job(job)
 
 # --- 5. UI & LOGIC ---
 if "view_mode" not in st.session_state: st.session_state.view_mode = "audit"
 if "audit_run" not in st.session_state: st.session_state.audit_run = False
 if "logs" not in st.session_state: st.session_state.logs = {"structure": [], "facts": []}
 if "show_pass" not in st.session_state: st.session_state.show_pass = True
+if "incremental" not in st.session_state: st.session_state.incremental = True
+if "block_memo" not in st.session_state: st.session_state.block_memo = None
+if "last_trace" not in st.session_state: st.session_state.last_trace = None
+if "report_memo" not in st.session_state: st.session_state.report_memo = {}
+if "job_id" not in st.session_state: st.session_state.job_id = None
+if "job_cursor" not in st.session_state: st.session_state.job_cursor = -1
+if "job_finalized" not in st.session_state: st.session_state.job_finalized = False
+if "job_render_seconds" not in st.session_state: st.session_state.job_render_seconds = 0.0
+
+# ?job=<id> in the URL reattaches a reloaded tab (or a colleague's link) to that audit.
+if st.query_params.get("job") and st.query_params["job"] != st.session_state.job_id and runner.store.job(st.query_params["job"]):
+    attach_job(st.query_params["job"])
 
 # --- SIDEBAR (RESTORED) ---
 with st.sidebar:
     st.success("🔓 Logged in")
     st.divider()
     st.info(f"🧠 Brain: {len(facts)} items\n📏 Rules: {len(larry_rules)}\n⚡ Overrides: {len(overrides)}")
+    if kb_error is not None:
+        st.warning(f"⚠️ Knowledge base not loaded ({type(kb_error).__name__}: {kb_error}). Fact checks run without KB context.")
+    w = warmup.snapshot()
+    if w["first_paint_ms"] is not None:
+        over = f" ⚠️ over the {FIRST_PAINT_BUDGET_MS} ms budget" if w["first_paint_ms"] > FIRST_PAINT_BUDGET_MS else ""
+        st.caption(f"🚀 Cold start: login painted in {w['first_paint_ms']} ms{over}, ready to audit after {w['seconds']:.1f}s")
+    cache_stats_slot = st.empty()
+    diagnostics_slot = st.empty()
     if st.session_state.view_mode == "audit":
         st.session_state.show_pass = st.checkbox("Show Passing Items (Audit View)", value=st.session_state.show_pass)
+        st.session_state.incremental = st.checkbox("♻️ Only re-check changed blocks", value=st.session_state.incremental,
+                                                   help="Reuse LLM results for blocks that are unchanged since the last audit.")
+    with st.expander("🗂️ Audit jobs"):
+        for j in runner.store.recent(JOB_LIST_SIZE):
+            progress_text = f"{j['done']}/{j['total']}" if j["status"] == "running" else j["status"]
+            st.button(f"{JOB_ICON.get(j['status'], '')} {j['keyword'] or '(no keyword)'} · {progress_text} · {time.strftime('%b %d %H:%M', time.localtime(j['created']))}",
+                      key=f"job_{j['id']}", on_click=attach_job, args=(j["id"],), use_container_width=True)
+        job_lookup = st.text_input("Open job by ID", key="job_lookup").strip()
+        if job_lookup and job_lookup != st.session_state.job_id:
+            if runner.store.job(job_lookup): st.button("Open", on_click=attach_job, args=(job_lookup,))
+            else: st.caption("No job with that ID.")
     if st.button("🔒 Logout"): st.session_state.authenticated = False; st.rerun()
 
 # --- MAIN AUDIT VIEW ---
@@ -256,234 +374,36 @@ if st.session_state.view_mode == "audit":
     draft_html = st_quill(placeholder="Paste content here...", html=True, key="quill")
 
     if st.button("🚀 Audit Content", type="primary"):
-        st.session_state.logs = {"structure": [], "facts": []}
-        st.session_state.audit_run = True
-        
         if not draft_html: st.warning("Input is empty."); st.stop()
-        
-        # --- PARSING ---
-        soup = BeautifulSoup(draft_html, "html.parser")
-        elements = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'div', 'li'])
-        links = soup.find_all('a')
-        
-        # Fallback for plain text
-        if len(elements) < 1:
-            raw_text = soup.get_text(separator="\n")
-            blocks = [b.strip() for b in raw_text.split('\n') if len(b.strip()) > 5]
-            elements = []
-            for b in blocks:
-                tag = soup.new_tag("p")
-                tag.string = b
-                elements.append(tag)
-
-        # --- SETUP CONTAINERS FOR REAL-TIME DISPLAY ---
-        progress = st.progress(0, text="Initializing...")
-        
-        st.subheader("SEO and AEO Structure Audit")
-        struct_con = st.container()
-        
-        st.subheader("Facts, Grammar, and Style Audit")
-        fact_con = st.container()
-
-        # --- 1. GLOBAL CHECKS (LINKS) ---
-        link_count = len(links)
-        l_res = {}
-        if link_count > 4:
-            l_res = {"status": "FAIL", "header": f"Link Count: {link_count} (Limit is 4)", "quote": "Too many links."}
-        elif link_count == 0:
-            l_res = {"status": "FAIL", "header": "Link Count: 0 (Min 2 required)", "quote": "No links found."}
+        # Unchanged blocks reuse the previous run's LLM results when incremental mode is on.
+        previous = st.session_state.block_memo if st.session_state.incremental else None
+        attach_job(runner.submit(draft_html, target_kw, previous=previous))
+
+    # --- JOB PROGRESS & FINDINGS ---
+    # The audit itself runs in the background (audit_jobs.py); this view reads what it has written so far.
+    if st.session_state.job_id:
+        job = runner.store.job(st.session_state.job_id)
+        if job is None:
+            st.error(f"No audit job with ID {st.session_state.job_id}.")
+        elif job["status"] in FINISHED:
+            render_job(job)
+            finalize_job(job)
         else:
-            l_res = {"status": "PASS", "header": f"Found {link_count} links (Pass)", "quote": "OK."}
-        
-        st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "SEO | LINK COUNT", **l_res})
-        if l_res['status'] != 'PASS' or st.session_state.show_pass:
-            css = "fail-box" if l_res['status'] == "FAIL" else "pass-box"
-            struct_con.markdown(f"<div class='{css}'><strong>{l_res['header']}</strong></div>", unsafe_allow_html=True)
-
-        # --- 2. MAIN LOOP ---
-        current_section_words = 0
-        current_h2 = None
-        h2_keyword_found = False
-        para_counter = 0
-        
-        for i, el in enumerate(elements):
-            text = el.get_text().strip()
-            if not text or len(text) < 2: continue 
-            
-            progress.progress((i+1)/len(elements), text=f"Auditing Block {i+1}...")
-            words = text.split()
-            tag = el.name if el.name else "p"
-            
-            # --- STRUCTURE: H1 ---
-            if tag == 'h1':
-                if target_kw and target_kw.lower() in text.lower():
-                    res = {"status": "PASS", "header": f"Includes keyword '{target_kw}'", "quote": text}
-                else:
-                    res = {"status": "FAIL", "header": f"Missing keyword '{target_kw}'", "quote": text}
-                st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "H1 HEADER", **res})
-                if res['status'] != 'PASS' or st.session_state.show_pass:
-                    css = "fail-box" if res['status'] == "FAIL" else "pass-box"
-                    struct_con.markdown(f"<div class='{css}'><strong>{res['header']}</strong><br><em>{res['quote']}</em></div>", unsafe_allow_html=True)
-
-            # --- STRUCTURE: H2 ---
-            elif tag == 'h2':
-                if current_h2 and current_section_words > 300:
-                    res = {"status": "FAIL", "header": f"Section '{current_h2[:30]}...' is {current_section_words} words. Limit is 300.", "quote": ""}
-                    st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "H2 SECTION LENGTH", **res})
-                    struct_con.markdown(f"<div class='fail-box'><strong>{res['header']}</strong></div>", unsafe_allow_html=True)
-
-                current_section_words = 0
-                current_h2 = text
-                if target_kw and target_kw.lower() in text.lower():
-                    h2_keyword_found = True
-
-            # --- STRUCTURE: LIST CONTAINERS ---
-            elif tag in ['ul', 'ol']:
-                list_items = el.find_all('li', recursive=False)
-                count = len(list_items)
-                
-                if count > 0 and count < 3:
-                    res = {"status": "WARN", "header": f"List has only {count} items.", "quote": "Fewer than 3 items lacks meaningful structure."}
-                    st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "LIST CHUNKING", **res})
-                    struct_con.markdown(f"<div class='warn-box'><span class='meta-label'>LIST CHUNKING</span><strong>{res['header']}</strong><br><em>{res['quote']}</em></div>", unsafe_allow_html=True)
-                elif count > 5:
-                    res = {"status": "FAIL", "header": f"List has {count} items (Limit is 5).", "quote": "Exceeds working-memory span."}
-                    st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "LIST CHUNKING", **res})
-                    struct_con.markdown(f"<div class='fail-box'><span class='meta-label'>LIST CHUNKING</span><strong>{res['header']}</strong><br><em>{res['quote']}</em></div>", unsafe_allow_html=True)
-
-            # --- STRUCTURE: LIST ITEMS ---
-            elif tag == 'li':
-                current_section_words += len(words)
-                if len(words) > 30:
-                    res = {"status": "FAIL", "header": f"Bullet is {len(words)} words (Limit 30).", "quote": text[:50]+"..."}
-                    st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "BULLET LENGTH", **res})
-                    struct_con.markdown(f"<div class='fail-box'><span class='meta-label'>BULLET LENGTH</span><strong>{res['header']}</strong><br><em>{res['quote']}</em></div>", unsafe_allow_html=True)
-
-                if len(words) > 5:
-                    try:
-                        with dspy.context(lm=lm_object):
-                            pred = bot.audit_structure(paragraph=text)
-                        if pred.status == "FAIL":
-                            st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "BULLET CONTEXT", "status": "FAIL", "header": "Bullet not self-contained", "quote": text[:50]+"..."})
-                            struct_con.markdown(f"<div class='fail-box'><span class='meta-label'>BULLET CONTEXT</span><strong>Bullet not self-contained</strong><br><em>{text[:50]}...</em></div>", unsafe_allow_html=True)
-                    except: pass
-
-            # --- STRUCTURE: PARAGRAPHS ---
-            elif tag in ['p', 'div', 'h3', 'h4', 'h5', 'h6']:
-                current_section_words += len(words)
-                
-                if len(words) > 5:
-                    para_counter += 1
-                    sentences = split_sentences(text)
-
-                    if para_counter == 1:
-                        if target_kw and target_kw.lower() in sentences[0].lower():
-                            res = {"status": "PASS", "header": f"Keyword '{target_kw}' found.", "quote": text[:100]}
-                        else:
-                            res = {"status": "FAIL", "header": f"Keyword '{target_kw}' missing.", "quote": text[:100]}
-                        st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "FIRST SENTENCE", **res})
-                        if res['status'] != 'PASS' or st.session_state.show_pass:
-                            css = "fail-box" if res['status'] == "FAIL" else "pass-box"
-                            struct_con.markdown(f"<div class='{css}'><strong>{res['header']}</strong><br><em>{res['quote']}</em></div>", unsafe_allow_html=True)
-
-                    len_res = None
-                    if len(sentences) > 4:
-                        len_res = {"status": "FAIL", "header": f"Too Long ({len(sentences)} sentences)", "quote": text[:50]+"..."}
-                    elif len(words) > 80:
-                        len_res = {"status": "FAIL", "header": f"Wall of Text ({len(words)} words)", "quote": text[:50]+"..."}
-                    elif len(sentences) < 2 and len(words) > 20:
-                        len_res = {"status": "WARN", "header": f"Too Short ({len(sentences)} sentence - Aim for 2-4)", "quote": text[:50]+"..."}
-                    
-                    if len_res:
-                        st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "PARAGRAPH LENGTH", **len_res})
-                        css = "fail-box" if len_res['status'] == "FAIL" else "warn-box"
-                        struct_con.markdown(f"<div class='{css}'><strong>{len_res['header']}</strong><br><em>{len_res['quote']}</em></div>", unsafe_allow_html=True)
-
-                    try:
-                        with dspy.context(lm=lm_object):
-                            pred = bot.audit_structure(paragraph=text)
-                        st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "AEO CHUNKING", "status": pred.status, "header": pred.reason, "quote": text[:50]+"..."})
-                        if pred.status != "PASS" or st.session_state.show_pass:
-                            css = "fail-box" if pred.status == "FAIL" else "pass-box"
-                            struct_con.markdown(f"<div class='{css}'><span class='meta-label'>AEO CHUNKING</span><strong>{pred.reason}</strong><br><em>{text[:50]}...</em></div>", unsafe_allow_html=True)
-                    except: pass
-
-            # --- FACTS & GRAMMAR LOOP ---
-            is_header = tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
-            if is_header: sentences = [text] 
-            else: sentences = split_sentences(text)
-
-            for sent in sentences:
-                # 1. LARRY RULES
-                hit_rule = False
-                for rule in larry_rules:
-                    if any(t.lower() in sent.lower() for t in rule["triggers"]):
-                        if all(m.lower() in sent.lower() for m in rule.get("must_also_contain", [])):
-                            res = {"status": "FAIL", "label": "LARRY RULE", "header": rule['message'], "quote": sent}
-                            st.session_state.logs["facts"].append({"id": str(uuid.uuid4()), **res})
-                            fact_con.markdown(f"<div class='fail-box'>❌ <strong>{rule['message']}</strong><br><em>{sent}</em></div>", unsafe_allow_html=True)
-                            hit_rule = True
-                if hit_rule: continue
-                
-                # 2. GRAMMAR
-                if not is_header:
-                    style_flags = check_grammar_and_style(sent)
-                    if style_flags:
-                        res = {"status": "WARN", "label": "STYLE", "header": ", ".join(style_flags), "quote": sent}
-                        st.session_state.logs["facts"].append({"id": str(uuid.uuid4()), **res})
-                        fact_con.markdown(f"<div class='warn-box'>⚠️ <strong>{res['header']}</strong><br><em>{sent}</em></div>", unsafe_allow_html=True)
-
-                    # 3. DSPy FACT
-                    ctx = "No specific internal match found."
-                    emb = get_embedding_openai(sent)
-                    if emb is not None and vectors is not None and len(vectors) > 0:
-                        sims = cosine_similarity(np.array(emb).reshape(1, -1), vectors)
-                        top_idx = np.argsort(sims[0])[-2:][::-1]
-                        if sims[0][top_idx[0]] > 0.15:
-                            ctx = " | ".join([facts[x] for x in top_idx])
-                    
-                    overrides_str = "; ".join(overrides)
-                    with dspy.context(lm=lm_object):
-                        pred = bot.audit_fact(sentence=sent, context=ctx, overrides=overrides_str)
-                    
-                    st.session_state.logs["facts"].append({"id": str(uuid.uuid4()), "status": pred.status, "label": "FACT/STYLE", "header": pred.reason, "quote": sent})
-                    
-                    if pred.status != "PASS" or st.session_state.show_pass:
-                        css = "fail-box" if pred.status == "FAIL" else "warn-box" if pred.status == "WARN" else "pass-box"
-                        icon = "✅" if pred.status == "PASS" else "❌" if pred.status == "FAIL" else "⚠️"
-                        fact_con.markdown(f"<div class='{css}'><span class='meta-label'>FACT/STYLE</span><strong>{icon} {pred.reason}</strong><br><em>{sent}</em></div>", unsafe_allow_html=True)
-
-        # --- FINAL CHECKS ---
-        if current_h2 and current_section_words > 300:
-             res = {"status": "FAIL", "header": f"Section '{current_h2[:30]}...' is {current_section_words} words. Limit is 300.", "quote": ""}
-             st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "H2 SECTION LENGTH", **res})
-             struct_con.markdown(f"<div class='fail-box'><strong>{res['header']}</strong></div>", unsafe_allow_html=True)
-             
-        if target_kw:
-            if h2_keyword_found:
-                res = {"status": "PASS", "header": "Primary keyword found in at least one H2.", "quote": ""}
-            else:
-                res = {"status": "FAIL", "header": f"Primary keyword '{target_kw}' NOT found in any H2.", "quote": ""}
-            st.session_state.logs["structure"].append({"id": str(uuid.uuid4()), "label": "H2 KEYWORDS", **res})
-            if res['status'] != 'PASS' or st.session_state.show_pass:
-                css = "pass-box" if res['status'] == "PASS" else "fail-box"
-                struct_con.markdown(f"<div class='{css}'><strong>{res['header']}</strong></div>", unsafe_allow_html=True)
-
-        progress.empty()
-        st.success("Audit Complete.")
-        
+            poll_job(job["id"])
+
     # --- EXPORT BUTTON (PERSISTENT) ---
     if st.session_state.audit_run:
         st.divider()
         if st.button("Create and Export Results"):
-            if "selected_ids" in st.session_state: del st.session_state.selected_ids
+            for key in ("selected_ids", "export_status_filter", "export_label_filter", "export_page"):
+                st.session_state.pop(key, None)
             st.session_state.view_mode = "export"
             st.rerun()
 
 # --- EXPORT VIEW ---
 elif st.session_state.view_mode == "export":
     st.title("📝 Report Export Setup")
-    st.info("Review audit items below. Uncheck any items you wish to exclude from the final HTML report.")
+    st.info("Review audit items below. Uncheck any items you wish to exclude from the final HTML report, or filter the list and select or deselect everything that matches.")
     
     # CRITICAL FIX: Only select items that match your current 'Show Pass' setting.
     if "selected_ids" not in st.session_state:
@@ -507,50 +427,94 @@ elif st.session_state.view_mode == "export":
 
     st.divider()
 
-    def display_selectable_logs(log_type, section_title):
-        logs = st.session_state.logs[log_type]
-        filtered_logs_for_display = [r for r in logs if st.session_state.show_pass or r['status'] != 'PASS']
-
-        if filtered_logs_for_display:
-            st.subheader(f"{section_title} ({len(filtered_logs_for_display)} items)")
-            for item in filtered_logs_for_display:
-                c_chk, c_card = st.columns([0.5, 11.5])
-                with c_chk:
-                    is_selected = item['id'] in st.session_state.selected_ids
-                    def update_selection(item_id=item['id']):
-                        if item_id in st.session_state.selected_ids:
-                            st.session_state.selected_ids.remove(item_id)
-                        else:
-                            st.session_state.selected_ids.add(item_id)
-
-                    st.checkbox("", value=is_selected, key=f"chk_{item['id']}", on_change=update_selection, label_visibility="collapsed")
-
-                with c_card:
-                    css = "fail-box" if item['status'] == "FAIL" else "warn-box" if item['status'] == "WARN" else "pass-box"
-                    label_html = f"<span class='meta-label'>{item.get('label','')}</span>" if item.get('label') else ""
-                    quote_text = item.get('quote', '')
-                    quote_html = f"<br><em>{quote_text}</em>" if quote_text else ""
-                    st.markdown(f"<div class='{css}' style='margin-bottom:5px;'>{label_html}<strong>{item['header']}</strong>{quote_html}</div>", unsafe_allow_html=True)
-            st.divider()
+    # Only one page of cards (and checkboxes) is rendered per rerun, so clicks cost the
+    # same on a 50-item log as on a 5,000-item one. Filters narrow the list, not the report.
+    all_items = [(log_type, item) for log_type in ("structure", "facts") for item in st.session_state.logs[log_type]]
+    label_options = sorted({item.get('label') or NO_LABEL for _, item in all_items})
+    if "export_status_filter" not in st.session_state:
+        st.session_state.export_status_filter = [s for s in ("FAIL", "WARN", "PASS") if st.session_state.show_pass or s != "PASS"]
+    st.session_state.export_label_filter = [l for l in st.session_state.get("export_label_filter", []) if l in label_options]
+
+    def matching_items():
+        statuses, labels = set(st.session_state.export_status_filter), set(st.session_state.export_label_filter)
+        return [(t, item) for t, item in all_items
+                if item['status'] in statuses and (not labels or (item.get('label') or NO_LABEL) in labels)]
+
+    def select_matching(selected):
+        ids = {item['id'] for _, item in matching_items()}
+        if selected: st.session_state.selected_ids |= ids
+        else: st.session_state.selected_ids -= ids
+
+    def reset_page(): st.session_state.export_page = 1
+
+    c_status, c_label, c_size = st.columns([2, 3, 1])
+    with c_status:
+        st.multiselect("Status", ["FAIL", "WARN", "PASS"], key="export_status_filter", on_change=reset_page)
+    with c_label:
+        st.multiselect("Label", label_options, key="export_label_filter", on_change=reset_page, placeholder="All labels")
+    with c_size:
+        page_size = st.selectbox("Per page", EXPORT_PAGE_SIZES, index=1, key="export_page_size", on_change=reset_page)
+
+    matching = matching_items()
+    n_pages = max(1, -(-len(matching) // page_size))
+    if st.session_state.get("export_page", 1) > n_pages: st.session_state.export_page = n_pages
+
+    c_sel, c_desel, c_page = st.columns([1, 1, 2])
+    with c_sel:
+        st.button(f"☑️ Select all {len(matching)} matching", on_click=select_matching, args=(True,), use_container_width=True)
+    with c_desel:
+        st.button(f"⬜ Deselect all {len(matching)} matching", on_click=select_matching, args=(False,), use_container_width=True)
+    with c_page:
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key="export_page")
+
+    start = (page - 1) * page_size
+    page_items = matching[start:start + page_size]
+    st.caption(f"Showing {start + 1 if page_items else 0}–{start + len(page_items)} of {len(matching)} matching items "
+               f"({len(all_items)} in the audit). Selected items stay in the report when filtered out.")
+
+    def update_selection(item_id):
+        if st.session_state[f"chk_{item_id}"]: st.session_state.selected_ids.add(item_id)
+        else: st.session_state.selected_ids.discard(item_id)
 
     with st.container(height=600, border=True):
-        display_selectable_logs("structure", "SEO and AEO Structure")
-        display_selectable_logs("facts", "Facts, Grammar, and Style")
-
-    final_s_logs = [item for item in st.session_state.logs["structure"] if item['id'] in st.session_state.selected_ids]
-    final_f_logs = [item for item in st.session_state.logs["facts"] if item['id'] in st.session_state.selected_ids]
-
-    html = generate_report(final_s_logs, final_f_logs, title, notes, include_pass=True)
+        section = None
+        for log_type, item in page_items:
+            if log_type != section:
+                section = log_type
+                st.subheader(EXPORT_SECTIONS[log_type])
+            c_chk, c_card = st.columns([0.5, 11.5])
+            with c_chk:
+                # Synced from selected_ids every run so bulk actions show up on the page.
+                st.session_state[f"chk_{item['id']}"] = item['id'] in st.session_state.selected_ids
+                st.checkbox("Include in report", key=f"chk_{item['id']}", on_change=update_selection, args=(item['id'],), label_visibility="collapsed")
+            with c_card:
+                css = "fail-box" if item['status'] == "FAIL" else "warn-box" if item['status'] == "WARN" else "pass-box"
+                label_html = f"<span class='meta-label'>{item.get('label','')}</span>" if item.get('label') else ""
+                quote_text = item.get('quote', '')
+                quote_html = f"<br><em>{quote_text}</em>" if quote_text else ""
+                st.markdown(f"<div class='{css}' style='margin-bottom:5px;'>{label_html}<strong>{item['header']}</strong>{quote_html}</div>", unsafe_allow_html=True)
+        if not page_items: st.caption("No items match the filters.")
 
     safe_title = re.sub(r'\W+', '_', title).lower().strip('_')
     if not safe_title: safe_title = "audit_report"
-    file_name = f"{safe_title}.html"
 
     st.divider()
-    c1, c2 = st.columns(2)
+    c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
     with c1:
-        st.download_button("🎉 Download Final HTML Report", data=html, file_name=file_name, mime="text/html", type="primary", use_container_width=True)
+        st.download_button("🎉 Download Final HTML Report", data=generate_report("html", title, notes), file_name=f"{safe_title}.html",
+                           mime=REPORT_FORMATS["html"], type="primary", use_container_width=True)
     with c2:
+        st.download_button("⬇️ JSON", data=generate_report("json", title, notes), file_name=f"{safe_title}.json",
+                           mime=REPORT_FORMATS["json"], use_container_width=True, help="Compact JSON of the selected findings, for dashboards")
+    with c3:
+        st.download_button("⬇️ CSV", data=generate_report("csv", title, notes), file_name=f"{safe_title}.csv",
+                           mime=REPORT_FORMATS["csv"], use_container_width=True, help="One row per selected finding")
+    with c4:
         if st.button("⬅ Back to Auditor", use_container_width=True): 
             st.session_state.view_mode = "audit"
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+# --- SIDEBAR STATS ---
+# Filled in last, once per run, so they include a job finalized above.
+show_cache_stats()
+show_diagnostics()
@@ -0,0 +1,197 @@
+"""
+Audits a whole site's worth of pages in one go.
+
+    python batch_audit.py --source ipostal1_source --keyword "virtual mailbox"
+    python batch_audit.py --source pages.zip --keywords keywords.json --out audit_runs/release-42
+
+Pages run in parallel, but every LLM call goes through one shared executor and
+every embedding request through one semaphore, so `--llm-concurrency` and
+`--embed-concurrency` are global limits for the whole batch, not per page.
+
+Output (in --out):
+    findings/<page>-<hash>.jsonl   one finding per line, written when the page completes
+    traces/<page>-<hash>.json      timings, LLM latency/tokens, cache hits and errors for that audit
+    summary.csv                    one row per page with FAIL/WARN/PASS counts
+
+A page counts as done once its findings file exists, so re-running the same
+command resumes an interrupted batch and skips finished pages (pages whose HTML
+changed since get a new hash and are audited again). Use --force to redo everything.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import dspy
+from bs4 import BeautifulSoup
+
+from audit_cache import AuditCache
+from audit_engine import CASCADE_KB_SCORE, HTML_PARSER, LLM_MAX_TOKENS, LLM_MODEL, OVERRIDES_TOP_K, AuditEngine
+from build_kb import NOISE_TAGS, read_pages
+from embeddings import get_embedder
+from kb_index import KBIndex
+from llm_gateway import LLMGateway, SharedBudget
+from retrieval import DEFAULT_THRESHOLD, DEFAULT_TOP_K, RETRIEVERS, get_retriever
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KB_PATH = os.path.join(BASE_DIR, "ipostal1_knowledge_base.json")
+RULES_PATH = os.path.join(BASE_DIR, "larry_rules.json")
+OVERRIDES_PATH = os.path.join(BASE_DIR, "overrides.json")
+CACHE_PATH = os.path.join(BASE_DIR, ".audit_cache.sqlite3")
+LLM_BUDGET_PATH = os.path.join(BASE_DIR, ".audit_llm_budget.sqlite3")
+SUMMARY_FIELDS = ["page", "keyword", "FAIL", "WARN", "PASS", "findings", "seconds"]
+
+
+def main_content(raw):
+    """Page HTML without scripts, navigation, header and footer chrome."""
+    soup = BeautifulSoup(raw.decode("utf-8", errors="ignore"), HTML_PARSER)
+    for t in soup(NOISE_TAGS): t.decompose()
+    body = soup.body or soup
+    return body.decode_contents()
+
+
+def load_keywords(path):
+    """{page name: target keyword} from a JSON object or a two-column CSV."""
+    if not path: return {}
+    with open(path, "r", newline="") as f:
+        if path.lower().endswith(".json"): return json.load(f)
+        return {row[0]: row[1] for row in csv.reader(f) if len(row) >= 2}
+
+
+def findings_path(out_dir, name, page_hash):
+    slug = re.sub(r"\W+", "_", os.path.splitext(name)[0]).strip("_").lower()[:80] or "page"
+    return os.path.join(out_dir, "findings", f"{slug}-{page_hash}.jsonl")
+
+
+def trace_path(findings_file):
+    out_dir, name = os.path.split(findings_file)
+    return os.path.join(os.path.dirname(out_dir), "traces", os.path.splitext(name)[0] + ".json")
+
+
+def audit_page(engine, name, raw, keyword, path):
+    t0 = time.time()
+    run = engine.audit(main_content(raw), keyword)
+    findings = [{"page": name, **f} for f in run]
+    with open(trace_path(path), "w") as f: json.dump({"page": name, **run.trace.to_dict()}, f, indent=1)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for finding in findings: f.write(json.dumps(finding) + "\n")
+    os.replace(tmp, path)  # the page only counts as done once this lands
+    return time.time() - t0
+
+
+def summarize(path, name, keyword, seconds=""):
+    with open(path, "r") as f: findings = [json.loads(line) for line in f if line.strip()]
+    counts = Counter(f["status"] for f in findings)
+    return {"page": name, "keyword": keyword, "FAIL": counts["FAIL"], "WARN": counts["WARN"],
+            "PASS": counts["PASS"], "findings": len(findings), "seconds": seconds}
+
+
+def run_batch(engine, pages, out_dir, keyword="", keywords=None, docs=4, force=False, log=print):
+    """Audits [(name, raw bytes)] into `out_dir`; returns the summary rows in page order."""
+    keywords = keywords or {}
+    os.makedirs(os.path.join(out_dir, "findings"), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, "traces"), exist_ok=True)
+    jobs = []
+    for name, raw in pages:
+        path = findings_path(out_dir, name, hashlib.sha256(raw).hexdigest()[:12])
+        jobs.append((name, raw, keywords.get(name, keyword), path))
+
+    todo = [j for j in jobs if force or not os.path.exists(j[3])]
+    log(f"{len(jobs)} pages: {len(jobs) - len(todo)} already done, {len(todo)} to audit")
+
+    seconds = {}
+    with ThreadPoolExecutor(max_workers=max(1, docs)) as page_pool:
+        futures = {page_pool.submit(audit_page, engine, *job): job for job in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            name = futures[fut][0]
+            try:
+                seconds[name] = round(fut.result(), 1)
+                log(f"[{i}/{len(todo)}] {name} ({seconds[name]}s)")
+            except Exception as e:
+                log(f"[{i}/{len(todo)}] {name} FAILED: {type(e).__name__}: {e}")
+
+    rows = [summarize(path, name, kw, seconds.get(name, "")) for name, _, kw, path in jobs if os.path.exists(path)]
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def print_summary(rows, out=sys.stdout):
+    width = max([len("page")] + [len(r["page"]) for r in rows])
+    out.write(f"{'page':<{width}}  FAIL  WARN  PASS\n")
+    for r in rows:
+        out.write(f"{r['page']:<{width}}  {r['FAIL']:>4}  {r['WARN']:>4}  {r['PASS']:>4}\n")
+    totals = Counter()
+    for r in rows: totals.update({k: r[k] for k in ("FAIL", "WARN", "PASS")})
+    out.write(f"{'TOTAL':<{width}}  {totals['FAIL']:>4}  {totals['WARN']:>4}  {totals['PASS']:>4}\n")
+
+
+def build_engine(llm_concurrency, embed_concurrency, api_key=None, fact_batch_size=4,
+                 retrieval="dense", top_k=DEFAULT_TOP_K, threshold=DEFAULT_THRESHOLD, cascade=True,
+                 cascade_kb_score=None, llm_rpm=None, llm_tpm=None, overrides_top_k=OVERRIDES_TOP_K,
+                 llm_budget_path=LLM_BUDGET_PATH):
+    kb_index = KBIndex.load(KB_PATH)
+    rules, overrides = [], []
+    if os.path.exists(RULES_PATH):
+        with open(RULES_PATH, "r") as f: rules = json.load(f)
+    if os.path.exists(OVERRIDES_PATH):
+        with open(OVERRIDES_PATH, "r") as f: overrides = json.load(f)
+    lm = dspy.LM(LLM_MODEL, api_key=api_key, max_tokens=LLM_MAX_TOKENS, num_retries=0)   # the gateway retries
+    return AuditEngine(lm, kb_index=kb_index, rules=rules, overrides=overrides,
+                       embedder=get_embedder(kb_index.embed_model), cache=AuditCache(CACHE_PATH),
+                       executor=ThreadPoolExecutor(max_workers=max(1, llm_concurrency)),
+                       embed_concurrency=embed_concurrency, fact_batch_size=fact_batch_size,
+                       retriever=get_retriever(retrieval, kb_index, k=top_k, threshold=threshold),
+                       cascade=cascade, cascade_kb_score=cascade_kb_score,
+                       gateway=LLMGateway(rpm=llm_rpm, tpm=llm_tpm, shared=SharedBudget(llm_budget_path) if llm_budget_path else None),
+                       priority="batch", overrides_top_k=overrides_top_k)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Audit every page in a directory or .zip.")
+    ap.add_argument("--source", default=os.path.join(BASE_DIR, "ipostal1_source"), help="directory or .zip of .html pages")
+    ap.add_argument("--out", default=os.path.join(BASE_DIR, "audit_runs", time.strftime("%Y-%m-%d")), help="output directory")
+    ap.add_argument("--keyword", default="", help="target keyword for every page")
+    ap.add_argument("--keywords", help="JSON or CSV mapping page file name -> target keyword")
+    ap.add_argument("--docs", type=int, default=4, help="pages audited at once")
+    ap.add_argument("--llm-concurrency", type=int, default=16, help="LLM calls in flight across the whole batch")
+    ap.add_argument("--embed-concurrency", type=int, default=2, help="embedding requests in flight across the whole batch")
+    ap.add_argument("--fact-batch", type=int, default=4, help="sentences per fact-check call (1 = one call per sentence)")
+    ap.add_argument("--retrieval", choices=RETRIEVERS, default="dense", help="KB retrieval backend (lexical needs no embedding calls)")
+    ap.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="KB facts passed as context per sentence")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="minimum KB match score for a fact to be used")
+    ap.add_argument("--no-cascade", action="store_true", help="send every sentence to the full fact check (no pre-screen)")
+    ap.add_argument("--cascade-kb-score", type=float, help=f"KB match score that escalates a sentence by itself (default {CASCADE_KB_SCORE})")
+    ap.add_argument("--overrides-top-k", type=int, default=OVERRIDES_TOP_K, help="matching overrides sent with each fact check once the list has 20+ entries (0 = the whole list)")
+    ap.add_argument("--llm-rpm", type=int, help="LLM requests per minute, counting the app's calls too (default: no limit)")
+    ap.add_argument("--llm-tpm", type=int, help="LLM tokens per minute, counting the app's calls too (default: no limit)")
+    ap.add_argument("--llm-budget-file", default=LLM_BUDGET_PATH,
+                    help="budget window shared with the app, whose queued calls go first ('' = this run only)")
+    ap.add_argument("--force", action="store_true", help="re-audit pages that already have findings")
+    args = ap.parse_args(argv)
+    if not os.environ.get("OPENAI_API_KEY"): sys.exit("OPENAI_API_KEY is not set.")
+
+    engine = build_engine(args.llm_concurrency, args.embed_concurrency, os.environ["OPENAI_API_KEY"], args.fact_batch,
+                          args.retrieval, args.top_k, args.threshold, cascade=not args.no_cascade, cascade_kb_score=args.cascade_kb_score,
+                          llm_rpm=args.llm_rpm, llm_tpm=args.llm_tpm, overrides_top_k=args.overrides_top_k,
+                          llm_budget_path=args.llm_budget_file)
+    try:
+        rows = run_batch(engine, read_pages(args.source), args.out, keyword=args.keyword,
+                         keywords=load_keywords(args.keywords), docs=args.docs, force=args.force)
+    finally:
+        engine.executor.shutdown(wait=False, cancel_futures=True)
+    print_summary(rows)
+    print(f"\nFindings: {os.path.join(args.out, 'findings')}\nSummary:  {os.path.join(args.out, 'summary.csv')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Offline benchmark of the full audit pipeline.
+
+    python benchmark.py                                   # every page in ipostal1_source/, no added latency
+    python benchmark.py --llm-latency 0.8 --embed-latency 0.2 --label realistic
+    python benchmark.py --compare                         # diff against the previous run with the same settings
+    python benchmark.py --cold-start --repeat 3           # app time-to-first-paint in fresh processes
+
+The engine runs unchanged (block extraction, sentence splitting, rule matching,
+retrieval, the cascade, DSPy prompt formatting and reply parsing), but the LLM and
+the embeddings endpoint are deterministic local stand-ins: no API key, no spend,
+and two runs over the same pages make the same calls and get the same replies.
+With the latency flags at 0 the timings are CPU time spent in the audit loop; set
+them to model network round trips.
+
+Dense retrieval needs a KB embedded the same way as the queries, so the pages are
+also built into bench_runs/kb/ with the offline hashing embedder (only re-built
+when the pages change). No audit cache is used; every run does all the work.
+
+Each run writes bench_runs/<timestamp>[-label].json: the settings, environment,
+docs/sec, per-page and per-stage latency percentiles, LLM calls and tokens, peak
+memory and a digest of the findings. --compare prints the change against the newest
+earlier run with the same settings (or a given file); with --max-regression, a
+docs/sec drop larger than that percentage exits with status 1.
+
+--cold-start instead runs auditor_app.py in fresh interpreters (Streamlit's AppTest,
+placeholder secrets) and reports how long the login screen took to paint and how
+long the background warm-up took to be ready to audit (see warmup.py). A first
+paint over FIRST_PAINT_BUDGET_MS exits with status 1.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import dspy
+
+from audit_engine import CHARS_PER_TOKEN, LLM_MAX_TOKENS, AuditEngine
+from batch_audit import OVERRIDES_PATH, RULES_PATH, main_content
+from build_kb import build, read_pages
+from embeddings import HashingEmbedder
+from instrumentation import percentiles_ms
+from kb_index import KBIndex
+from retrieval import DEFAULT_THRESHOLD, DEFAULT_TOP_K, RETRIEVERS, get_retriever
+from warmup import FIRST_PAINT_BUDGET_MS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, "bench_runs")
+BENCH_FORMAT = 1
+BENCH_EMBED_DIM = 512
+NOISE_PCT = 10          # changes smaller than this are not called better or worse
+
+_FIELD_RE = re.compile(r"\[\[ ## (\w+) ## \]\]")
+_NUMBERED_RE = re.compile(r"^\d+\.\s+(.*)$", re.MULTILINE)
+
+
+def _unit(text):
+    """Deterministic float in [0, 1) for a string."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") / 2 ** 64
+
+
+class StandInLM(dspy.BaseLM):
+    """
+    Deterministic chat model. Fills in whichever output fields the DSPy adapter asks
+    for: the status is picked from a hash of the checked text (FAIL and WARN at the
+    given rates) and batch calls get one JSON verdict per numbered sentence. Each call
+    sleeps `latency` seconds on average (0.5x-1.5x, also hashed) and reports token usage
+    estimated from message length.
+    """
+    def __init__(self, latency=0.0, fail_rate=0.15, warn_rate=0.15):
+        super().__init__(model="bench/stand-in", cache=False, max_tokens=LLM_MAX_TOKENS)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.warn_rate = warn_rate
+
+    def verdict(self, text):
+        u = _unit(text)
+        if u < self.fail_rate: return {"status": "FAIL", "reason": "Stand-in verdict: contradicts the knowledge base."}
+        if u < self.fail_rate + self.warn_rate: return {"status": "WARN", "reason": "Stand-in verdict: needs a closer look."}
+        return {"status": "PASS", "reason": "Stand-in verdict: consistent with the knowledge base."}
+
+    def reply(self, request):
+        # Input fields come first in the user message; the output fields are named in its last line.
+        parts = _FIELD_RE.split(request)
+        inputs = {parts[i]: parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+        wanted = [f for f in _FIELD_RE.findall(request.rsplit("\n", 1)[-1]) if f != "completed"]
+        checked = next(iter(inputs.values()), request)
+        out = []
+        for name in wanted:
+            if name == "verdicts":
+                value = json.dumps([self.verdict(s) for s in _NUMBERED_RE.findall(inputs.get("sentences", ""))])
+            elif name in ("status", "reason"):
+                value = self.verdict(checked)[name]
+            else:
+                value = "Stand-in reasoning."
+            out.append(f"[[ ## {name} ## ]]\n{value}")
+        return "\n\n".join(out + ["[[ ## completed ## ]]"])
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        messages = messages or [{"role": "user", "content": prompt or ""}]
+        request = messages[-1]["content"]
+        if self.latency: time.sleep(self.latency * (0.5 + _unit(request)))
+        content = self.reply(request)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                   "total_tokens": prompt_tokens + completion_tokens},
+            model=self.model)
+
+
+class StandInEmbedder(HashingEmbedder):
+    """The offline hashing embedder, plus `latency` seconds per request like a network round trip."""
+    def __init__(self, dim=BENCH_EMBED_DIM, latency=0.0):
+        super().__init__(dim)
+        self.latency = latency
+
+    def embed(self, texts):
+        if self.latency: time.sleep(self.latency)
+        return super().embed(texts)
+
+
+def bench_kb(source, dim, log=print):
+    """KB built from `source` with the hashing embedder, kept in bench_runs/kb/ between runs."""
+    path = os.path.join(RESULTS_DIR, "kb", f"bench_kb_{dim}.json")
+    build(source, path, HashingEmbedder(dim), log=lambda msg: log(f"  kb: {msg}"))
+    return KBIndex.load(path)
+
+
+def load_json_list(path):
+    if not os.path.exists(path): return []
+    with open(path, "r") as f: return json.load(f)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                                    capture_output=True, text=True, timeout=10).stdout.strip())
+    except (OSError, subprocess.SubprocessError):
+        commit, dirty = "", False
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "dspy": getattr(dspy, "__version__", ""), "commit": commit, "dirty": dirty}
+
+
+def audit_page(engine, raw, keyword):
+    """(seconds, findings, trace) for one page, cleanup included."""
+    t0 = time.perf_counter()
+    html = main_content(raw)
+    clean = time.perf_counter() - t0
+    run = engine.audit(html, keyword)
+    findings = list(run)
+    run.trace.add_time("clean", clean)
+    return time.perf_counter() - t0, findings, run.trace
+
+
+def run_benchmark(engine, pages, keyword="", docs=1, repeat=1, warmup=1, log=print):
+    """Audits `pages` `repeat` times after `warmup` untimed pages; returns the metrics dict."""
+    for name, raw in pages[:warmup]:
+        log(f"warm-up: {name}")
+        audit_page(engine, raw, keyword)
+
+    jobs = [(name, raw) for _ in range(repeat) for name, raw in pages]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, docs)) as pool:
+        results = list(pool.map(lambda job: (job[0],) + audit_page(engine, job[1], keyword), jobs))
+    wall = time.perf_counter() - t0
+
+    stages, latencies, tokens = defaultdict(list), defaultdict(list), defaultdict(Counter)
+    counters, statuses, digest, per_page = Counter(), Counter(), hashlib.sha256(), []
+    for name, seconds, findings, trace in results:
+        per_page.append({"page": name, "seconds": round(seconds, 4), "findings": len(findings)})
+        for stage, sec in trace.stages.items(): stages[stage].append(sec)
+        for sig, samples in trace.latencies.items(): latencies[sig].extend(samples)
+        for sig, t in trace.tokens.items(): tokens[sig].update(t)
+        counters.update(trace.counters)
+        statuses.update(f["status"] for f in findings)
+        for f in findings: digest.update(json.dumps(f, sort_keys=True).encode("utf-8"))
+
+    return {
+        "docs": len(results),
+        "wall_seconds": round(wall, 3),
+        "docs_per_sec": round(len(results) / wall, 3) if wall else 0.0,
+        "doc_ms": percentiles_ms([r[1] for r in results]),
+        # Stage times are per page and summed across that page's threads (see instrumentation.py).
+        "stages_ms": {stage: percentiles_ms(samples) for stage, samples in sorted(stages.items())},
+        "llm": {sig: {"calls": len(latencies[sig]), "latency_ms": percentiles_ms(latencies[sig]),
+                      "prompt_tokens": tokens[sig]["prompt"], "completion_tokens": tokens[sig]["completion"]}
+                for sig in sorted(latencies)},
+        "counters": dict(sorted(counters.items())),
+        "findings": dict(sorted(statuses.items())),
+        "findings_digest": digest.hexdigest()[:16],
+        "pages": per_page,
+    }
+
+
+# --- cold start ---
+# Runs in a fresh interpreter: argv[1] is the app, argv[2] the warm-up status file to poll.
+COLD_START_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+from warmup import read_status
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.secrets["OPENAI_API_KEY"], at.secrets["APP_PASSWORD"] = "sk-benchmark", "benchmark"
+t0 = time.perf_counter()
+at.run()
+script_ms = (time.perf_counter() - t0) * 1000
+if at.exception or not at.text_input: sys.exit(f"The login screen did not render: {at.exception}")
+status = read_status(sys.argv[2])
+while status["state"] not in ("ready", "failed"):
+    time.sleep(0.01)
+    status = read_status(sys.argv[2])
+print(json.dumps({"script_ms": round(script_ms), **status}))
+"""
+
+
+def cold_start(app_path, runs=1):
+    """Per run in a fresh process: {first_paint_ms, script_ms, ready_ms, state, error}."""
+    status_path = os.path.join(RESULTS_DIR, f"cold-start-{os.getpid()}.json")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results = []
+    try:
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT, app_path, status_path], cwd=BASE_DIR,
+                                  env={**os.environ, "AUDIT_READY_FILE": status_path}, capture_output=True, text=True)
+            if proc.returncode: sys.exit(f"Cold-start run failed:\n{proc.stderr.strip()}")
+            status = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append({"first_paint_ms": status["first_paint_ms"], "script_ms": status["script_ms"],
+                            "ready_ms": round(status["seconds"] * 1000), "state": status["state"], "error": status["error"]})
+    finally:
+        if os.path.exists(status_path): os.remove(status_path)
+    return results
+
+
+def print_cold_start(runs, out=sys.stdout):
+    for i, r in enumerate(runs, 1):
+        out.write(f"run {i}: login painted in {r['first_paint_ms']} ms (script run {r['script_ms']} ms), "
+                  f"warm-up {r['state']} after {r['ready_ms']} ms" + (f": {r['error']}" if r["error"] else "") + "\n")
+    paints = sorted(r["first_paint_ms"] for r in runs)
+    out.write(f"first paint median {paints[len(paints) // 2]} ms, worst {paints[-1]} ms (budget {FIRST_PAINT_BUDGET_MS} ms)\n")
+    return paints[-1]
+
+
+# --- comparison ---
+COMPARED = [("docs/sec", ("metrics", "docs_per_sec"), True), ("page p50 ms", ("metrics", "doc_ms", "p50"), False),
+            ("page p90 ms", ("metrics", "doc_ms", "p90"), False), ("peak RSS MB", ("memory", "peak_rss_mb"), False),
+            ("Python heap MB", ("memory", "python_peak_mb"), False)]
+
+
+def _lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result: return None
+        result = result[key]
+    return result
+
+
+def previous_result(config, exclude, results_dir=RESULTS_DIR):
+    """Newest saved run with the same settings, other than `exclude`."""
+    for path in sorted(glob.glob(os.path.join(results_dir, "*.json")), reverse=True):
+        if os.path.abspath(path) == os.path.abspath(exclude): continue
+        try:
+            with open(path, "r") as f: result = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if result.get("format") == BENCH_FORMAT and result.get("config") == config:
+            return path, result
+    return None, None
+
+
+def compare(old, new, out=sys.stdout):
+    """Prints old vs. new; returns the docs/sec change in percent (positive = faster)."""
+    rows = [(label, _lookup(old, path), _lookup(new, path), higher_better) for label, path, higher_better in COMPARED]
+    stage_names = sorted(set(old.get("metrics", {}).get("stages_ms", {})) | set(new.get("metrics", {}).get("stages_ms", {})))
+    rows += [(f"{s} p50 ms", _lookup(old, ("metrics", "stages_ms", s, "p50")), _lookup(new, ("metrics", "stages_ms", s, "p50")), False)
+             for s in stage_names]
+    width = max(len(r[0]) for r in rows)
+    out.write(f"{'':<{width}}  {'previous':>10}  {'current':>10}  change\n")
+    speedup = 0.0
+    for label, before, after, higher_better in rows:
+        if before is None and after is None: continue
+        change = ""
+        if before and after is not None:
+            pct = (after - before) / before * 100
+            better = pct > 0 if higher_better else pct < 0
+            change = f"{pct:+.1f}%" + ("" if abs(pct) < NOISE_PCT else " (better)" if better else " (worse)")
+            if label == "docs/sec": speedup = pct
+        out.write(f"{label:<{width}}  {before if before is not None else '-':>10}  {after if after is not None else '-':>10}  {change}\n")
+    if old["metrics"].get("findings_digest") != new["metrics"].get("findings_digest"):
+        out.write("Findings differ from the previous run: the change affects audit results, not just speed.\n")
+    return speedup
+
+
+def print_report(result, out=sys.stdout):
+    m = result["metrics"]
+    out.write(f"{m['docs']} pages in {m['wall_seconds']}s: {m['docs_per_sec']} docs/sec, "
+              f"page p50 {m['doc_ms'].get('p50')} ms / p90 {m['doc_ms'].get('p90')} ms, "
+              f"peak RSS {result['memory']['peak_rss_mb']} MB\n")
+    width = max([len("stage")] + [len(s) for s in m["stages_ms"]])
+    out.write(f"{'stage':<{width}}  {'p50 ms':>9}  {'p90 ms':>9}  {'p99 ms':>9}\n")
+    for stage, p in m["stages_ms"].items():
+        out.write(f"{stage:<{width}}  {p['p50']:>9}  {p['p90']:>9}  {p['p99']:>9}\n")
+    for sig, s in m["llm"].items():
+        out.write(f"{sig}: {s['calls']} calls, p50 {s['latency_ms'].get('p50')} ms, "
+                  f"{s['prompt_tokens']} prompt / {s['completion_tokens']} completion tokens\n")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the audit pipeline offline with stand-in LLM and embeddings.")
+    ap.add_argument("--source", default=os.path.join(BASE_DIR, "ipostal1_source"), help="directory or .zip of .html pages")
+    ap.add_argument("--keyword", default="virtual mailbox", help="target keyword for every page")
+    ap.add_argument("--pages", type=int, help="only the first N pages")
+    ap.add_argument("--repeat", type=int, default=1, help="audit every page this many times")
+    ap.add_argument("--warmup", type=int, default=1, help="untimed pages audited first")
+    ap.add_argument("--docs", type=int, default=1, help="pages audited at once")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="mean seconds per stand-in LLM call")
+    ap.add_argument("--embed-latency", type=float, default=0.0, help="seconds per stand-in embedding request")
+    ap.add_argument("--llm-concurrency", type=int, default=16, help="LLM calls in flight across all pages")
+    ap.add_argument("--embed-concurrency", type=int, default=2, help="embedding requests in flight across all pages")
+    ap.add_argument("--fact-batch", type=int, default=4, help="sentences per fact-check call (1 = one call per sentence)")
+    ap.add_argument("--retrieval", choices=RETRIEVERS, default="dense", help="KB retrieval backend")
+    ap.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="KB facts passed as context per sentence")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="minimum KB match score for a fact to be used")
+    ap.add_argument("--no-cascade", action="store_true", help="send every sentence to the full fact check")
+    ap.add_argument("--cascade-kb-score", type=float, help="KB match score that escalates a sentence by itself")
+    ap.add_argument("--tracemalloc", action="store_true", help="also record peak Python heap (slows the run down)")
+    ap.add_argument("--label", default="", help="suffix for the results file name")
+    ap.add_argument("--compare", nargs="?", const="previous", help="compare with the previous matching run, or with this results file")
+    ap.add_argument("--max-regression", type=float, help="exit 1 if docs/sec drops by more than this percentage")
+    ap.add_argument("--cold-start", action="store_true", help="measure the app's time-to-first-paint instead (--repeat runs)")
+    args = ap.parse_args(argv)
+
+    if args.cold_start:
+        runs = cold_start(os.path.join(BASE_DIR, "auditor_app.py"), max(1, args.repeat))
+        if print_cold_start(runs) > FIRST_PAINT_BUDGET_MS: sys.exit(1)
+        if any(r["state"] != "ready" for r in runs): sys.exit(1)
+        return
+
+    source_pages = read_pages(args.source)
+    pages = source_pages[:args.pages]
+    if not pages: sys.exit(f"No .html pages in {args.source}")
+    config = {k: v for k, v in vars(args).items() if k not in ("source", "tracemalloc", "label", "compare", "max_regression")}
+    config["pages"] = hashlib.sha256(b"".join(raw for _, raw in pages)).hexdigest()[:16]
+
+    print(f"Building the benchmark KB from all {len(source_pages)} source pages...")
+    kb_index = bench_kb(args.source, BENCH_EMBED_DIM)
+    engine = AuditEngine(StandInLM(args.llm_latency), kb_index=kb_index, rules=load_json_list(RULES_PATH),
+                         overrides=load_json_list(OVERRIDES_PATH), embedder=StandInEmbedder(BENCH_EMBED_DIM, args.embed_latency),
+                         cache=None, executor=ThreadPoolExecutor(max_workers=max(1, args.llm_concurrency)),
+                         embed_concurrency=args.embed_concurrency, fact_batch_size=args.fact_batch,
+                         retriever=get_retriever(args.retrieval, kb_index, k=args.top_k, threshold=args.threshold),
+                         cascade=not args.no_cascade, cascade_kb_score=args.cascade_kb_score)
+
+    if args.tracemalloc: tracemalloc.start()
+    try:
+        metrics = run_benchmark(engine, pages, args.keyword, docs=args.docs, repeat=args.repeat, warmup=args.warmup)
+    finally:
+        engine.executor.shutdown(wait=False, cancel_futures=True)
+    memory = {"peak_rss_mb": peak_rss_mb()}
+    if args.tracemalloc:
+        memory["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+
+    result = {"format": BENCH_FORMAT, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "label": args.label,
+              "config": config, "environment": environment(), "memory": memory, "metrics": metrics}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    slug = re.sub(r"\W+", "_", args.label).strip("_")
+    path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + (f"-{slug}" if slug else "") + ".json")
+    with open(path, "w") as f: json.dump(result, f, indent=1)
+    print()
+    print_report(result)
+    print(f"\nResults: {path}")
+
+    if args.compare:
+        if args.compare == "previous":
+            old_path, old = previous_result(config, path)
+        else:
+            old_path = args.compare
+            with open(old_path, "r") as f: old = json.load(f)
+        if old is None:
+            print("\nNo earlier run with the same settings to compare against.")
+            return
+        print(f"\nCompared with {os.path.relpath(old_path)}:")
+        speedup = compare(old, result)
+        if args.max_regression is not None and speedup < -args.max_regression:
+            sys.exit(f"docs/sec dropped {-speedup:.1f}% (limit {args.max_regression}%).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Builds ipostal1_knowledge_base.json (plus its float32 vector index) from saved
+iPostal1 pages.
+
+    python build_kb.py                                  # ipostal1_source/ -> ipostal1_knowledge_base.json
+    python build_kb.py --source ipostal1_source.zip
+    python build_kb.py --embedder hashing-512           # offline backend, no API key needed
+    python build_kb.py --index-only                     # vector index for the existing KB (image builds)
+
+Pages are parsed in a process pool and chunked into question/answer entries
+(FAQ <dt>/<dd> pairs, otherwise each heading with the text under it). Each page's
+chunks are cached by content hash in <kb>.chunks.json, including pages that yield
+none, so a rebuild only re-parses pages whose HTML changed. Embeddings are reused
+from the previous KB by text; any chunk without one (new, or failed last time) is
+embedded again. Chunks repeated across pages are kept once, when the output is
+assembled, so a shared chunk survives a change to the first page that had it.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from embeddings import OPENAI_EMBED_MODEL, get_embedder
+from kb_index import KBIndex
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(BASE_DIR, "ipostal1_source")
+DEFAULT_OUT = os.path.join(BASE_DIR, "ipostal1_knowledge_base.json")
+
+NOISE_TAGS = ["script", "style", "noscript", "svg", "nav", "header", "footer", "form", "iframe"]
+HEADINGS = ["h1", "h2", "h3", "h4"]
+TEXT_BLOCKS = ["p", "li", "td", "blockquote"]
+MIN_ANSWER_WORDS = 8
+MAX_ANSWER_WORDS = 120
+CHUNKS_FORMAT = 1
+
+
+def read_pages(source):
+    """[(name, raw bytes)] for every .html page in a directory or .zip."""
+    pages = []
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                if name.lower().endswith((".html", ".htm")) and not os.path.basename(name).startswith("._"):
+                    pages.append((os.path.basename(name), zf.read(info)))
+    else:
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith((".html", ".htm")):
+                with open(os.path.join(source, name), "rb") as f: pages.append((name, f.read()))
+    return pages
+
+
+def _clean(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _split_answer(answer):
+    # Long sections become several entries of at most MAX_ANSWER_WORDS, cut on sentence ends.
+    sentences = re.split(r"(?<=[.!?])\s+", answer)
+    chunks, cur = [], []
+    for s in sentences:
+        if cur and len(" ".join(cur + [s]).split()) > MAX_ANSWER_WORDS:
+            chunks.append(" ".join(cur))
+            cur = []
+        cur.append(s)
+    if cur: chunks.append(" ".join(cur))
+    return chunks
+
+
+def chunk_page(name, raw):
+    """Parses one page into [{"question", "answer"}]. Runs in a worker process."""
+    soup = BeautifulSoup(raw.decode("utf-8", errors="ignore"), "html.parser")
+    for t in soup(NOISE_TAGS): t.decompose()
+    title = _clean(soup.title.get_text()) if soup.title else os.path.splitext(name)[0]
+    pairs = []
+
+    # 1. FAQ-style definition lists.
+    for dt in soup.find_all("dt"):
+        dd = dt.find_next_sibling("dd")
+        if dd is not None:
+            pairs.append((_clean(dt.get_text(" ")), _clean(dd.get_text(" "))))
+            dd.decompose()
+        dt.decompose()
+
+    # 2. Heading sections: leaf text blocks grouped under the nearest preceding heading.
+    question, body = title, []
+    for el in soup.find_all(HEADINGS + TEXT_BLOCKS):
+        if el.name in HEADINGS:
+            if body: pairs.append((question, " ".join(body)))
+            question, body = _clean(el.get_text(" ")) or question, []
+        elif not el.find(TEXT_BLOCKS):
+            text = _clean(el.get_text(" "))
+            if text: body.append(text)
+    if body: pairs.append((question, " ".join(body)))
+
+    entries = []
+    for q, a in pairs:
+        if not q or len(a.split()) < MIN_ANSWER_WORDS: continue
+        for part in _split_answer(a):
+            entries.append({"question": q, "answer": part})
+    return entries
+
+
+def chunks_path(out_path):
+    stem, _ = os.path.splitext(out_path)
+    return stem + ".chunks.json"
+
+
+def _load_json(path, default):
+    try:
+        with open(path, "r") as f: return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f: json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def build(source, out_path, embedder, workers=None, log=print):
+    t0 = time.time()
+    pages = [(name, raw, hashlib.sha256(raw).hexdigest()[:16]) for name, raw in read_pages(source)]
+
+    cache = _load_json(chunks_path(out_path), {})
+    cached = cache.get("pages", {}) if cache.get("format") == CHUNKS_FORMAT else {}
+    chunks = {name: cached[name]["chunks"] for name, _, page_hash in pages
+              if name in cached and cached[name].get("hash") == page_hash}
+    changed = [(name, raw, page_hash) for name, raw, page_hash in pages if name not in chunks]
+    log(f"{len(pages)} pages: {len(chunks)} unchanged, {len(changed)} to (re)parse")
+    if changed:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for (name, _, _), entries in zip(changed, pool.map(chunk_page, [n for n, _, _ in changed], [r for _, r, _ in changed])):
+                chunks[name] = entries
+
+    # Boilerplate blocks (CTAs, plan banners) repeat across pages; keep the first copy only.
+    ordered, seen = [], set()
+    for name, _, page_hash in pages:
+        for c in chunks[name]:
+            key = (c["question"], c["answer"])
+            if key not in seen:
+                seen.add(key)
+                ordered.append({**c, "source": name, "source_hash": page_hash, "embed_model": embedder.name})
+
+    # Embeddings from the previous build, by text, for this backend only.
+    vectors = {f"{e['question']} {e['answer']}": e["embedding"] for e in _load_json(out_path, [])
+               if e.get("embed_model") == embedder.name and "embedding" in e}
+    texts = [f"{e['question']} {e['answer']}" for e in ordered]
+    todo = [t for t in dict.fromkeys(texts) if t not in vectors]
+    fresh, errors = embedder.embed(todo) if todo else ({}, {})
+    for t, v in fresh.items(): vectors[t] = [round(float(x), 6) for x in v]
+    for t, err in errors.items(): log(f"  embedding failed: {err} :: {t[:60]}")
+    entries = [{**e, "embedding": vectors[t]} for e, t in zip(ordered, texts) if t in vectors]
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    _write_json(out_path, entries)
+    _write_json(chunks_path(out_path), {"format": CHUNKS_FORMAT, "pages": {
+        name: {"hash": page_hash, "chunks": chunks[name]} for name, _, page_hash in pages}})
+    index = KBIndex.build(out_path)
+    log(f"Wrote {len(entries)} entries ({len(todo) - len(errors)} embedded, {len(errors)} failed) "
+        f"and a {index.matrix.shape} float32 index in {time.time() - t0:.1f}s")
+    if errors: log("Entries that failed to embed are retried on the next run.")
+    return entries
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build the iPostal1 knowledge base from saved pages.")
+    ap.add_argument("--source", default=DEFAULT_SOURCE, help="directory or .zip of saved .html pages")
+    ap.add_argument("--out", default=DEFAULT_OUT, help="KB JSON to write (vector index is written beside it)")
+    ap.add_argument("--embedder", default=OPENAI_EMBED_MODEL, help="OpenAI model name or 'hashing-<dim>' for offline builds")
+    ap.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    ap.add_argument("--index-only", action="store_true", help="only (re)write the vector index beside --out; no parsing or embedding")
+    args = ap.parse_args(argv)
+    if args.index_only:
+        # Run at image-build time so a cold container memory-maps the index instead of parsing the KB JSON.
+        if not os.path.exists(args.out):
+            print(f"No KB at {args.out}; nothing to index.")
+            return
+        t0 = time.time()
+        index = KBIndex.build(args.out)
+        print(f"Wrote a {index.matrix.shape} float32 index for {len(index)} entries in {time.time() - t0:.1f}s")
+        return
+    if not args.embedder.startswith("hashing-") and not os.environ.get("OPENAI_API_KEY"):
+        sys.exit("OPENAI_API_KEY is not set (or pass --embedder hashing-512 for an offline build).")
+    build(args.source, args.out, get_embedder(args.embedder), workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Embedding backends shared by the app and the KB builder.
+
+Every backend exposes `name` (recorded in the KB and in cache keys) and
+`embed(texts) -> ({text: vector}, {text: error message})`, so callers can report
+failures per text instead of losing them.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+OPENAI_EMBED_MODEL = "text-embedding-3-small"
+EMBED_BATCH_SIZE = 2048        # API cap on inputs per request
+EMBED_BATCH_TOKENS = 250_000   # under the 300k tokens/request cap (estimated at ~4 chars/token)
+
+
+def embedding_batches(texts, max_items=EMBED_BATCH_SIZE, max_tokens=EMBED_BATCH_TOKENS):
+    batch, batch_tokens = [], 0
+    for t in texts:
+        tokens = len(t) // 4 + 1
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(t)
+        batch_tokens += tokens
+    if batch: yield batch
+
+
+class OpenAIEmbedder:
+    """Batched requests against the OpenAI embeddings endpoint through one shared client."""
+    def __init__(self, client, model=OPENAI_EMBED_MODEL):
+        self.client = client
+        self.model = model
+        self.name = model
+
+    def embed(self, texts):
+        """
+        Embeds every unique text in as few requests as the API allows. If a batch
+        request fails, its items are retried one by one so a single bad input only
+        costs itself.
+        """
+        vecs, errors = {}, {}
+        for batch in embedding_batches(list(dict.fromkeys(texts))):
+            try:
+                resp = self.client.embeddings.create(input=[t.replace("\n", " ") for t in batch], model=self.model)
+                for d in resp.data: vecs[batch[d.index]] = d.embedding
+            except Exception:
+                for t in batch:
+                    try:
+                        vecs[t] = self.client.embeddings.create(input=[t.replace("\n", " ")], model=self.model).data[0].embedding
+                    except Exception as e:
+                        errors[t] = f"{type(e).__name__}: {e}"
+        return vecs, errors
+
+
+class HashingEmbedder:
+    """
+    Offline, deterministic embedding: signed feature hashing of words and word
+    bigrams with log term frequency. No network or model download, so KB builds
+    and audits can run in tests and air-gapped environments.
+    """
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _vector(self, text):
+        words = re.findall(r"[a-z0-9$]+(?:[.'][a-z0-9]+)*", text.lower())
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for tok in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed(self, texts):
+        return {t: self._vector(t).tolist() for t in dict.fromkeys(texts)}, {}
+
+
+def get_embedder(name, client=None):
+    """Backend for an embedder name as recorded in the KB ('hashing-<dim>' or an OpenAI model)."""
+    if name.startswith("hashing-"):
+        return HashingEmbedder(int(name.split("-", 1)[1]))
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(max_retries=2)
+    return OpenAIEmbedder(client, name)
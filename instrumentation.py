@@ -0,0 +1,102 @@
+"""
+Per-audit instrumentation.
+
+An AuditTrace is filled in by the engine (and the app, for rendering) while an
+audit runs: wall time per stage, one record per LLM call (signature, latency,
+tokens, outcome), audit cache hits and misses, counters such as batch fallbacks,
+and the errors that the pipeline otherwise swallows. to_dict() gives a JSON
+trace that can be saved per audit and compared across releases.
+
+Stage times are summed across threads, so "embed" or "llm" can exceed the
+audit's wall time when calls overlap; "llm_wait" is the time the audit spent
+blocked on outstanding LLM calls.
+"""
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+TRACE_FORMAT = 1
+MAX_ERRORS = 50
+
+
+def percentiles_ms(samples):
+    if not samples: return {}
+    ms = np.asarray(samples) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"p50": round(p50, 1), "p90": round(p90, 1), "p99": round(p99, 1),
+            "max": round(float(ms.max()), 1), "mean": round(float(ms.mean()), 1)}
+
+
+class AuditTrace:
+    def __init__(self, audit_id=None):
+        self.audit_id = audit_id or uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.stages = Counter()                 # stage -> seconds
+        self.latencies = defaultdict(list)      # signature -> [seconds per LLM call]
+        self.tokens = defaultdict(Counter)      # signature -> {"prompt": n, "completion": n}
+        self.failures = Counter()               # signature -> failed calls
+        self.cache = defaultdict(Counter)       # cache kind -> {"hits": n, "misses": n}
+        self.counters = Counter()
+        self.errors = []
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def add_time(self, name, seconds):
+        with self.lock: self.stages[name] += seconds
+
+    def record_call(self, signature, seconds, usage=None, ok=True):
+        """One LLM round trip. `usage` is dspy's {model: {"prompt_tokens", "completion_tokens", ...}}."""
+        with self.lock:
+            self.latencies[signature].append(seconds)
+            self.stages["llm"] += seconds
+            if not ok: self.failures[signature] += 1
+            for model_usage in (usage or {}).values():
+                self.tokens[signature]["prompt"] += model_usage.get("prompt_tokens") or 0
+                self.tokens[signature]["completion"] += model_usage.get("completion_tokens") or 0
+
+    def cache_lookup(self, kind, hit):
+        with self.lock: self.cache[kind]["hits" if hit else "misses"] += 1
+
+    def count(self, name, n=1):
+        with self.lock: self.counters[name] += n
+
+    def error(self, where, exc):
+        with self.lock:
+            self.counters[f"errors.{where}"] += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append({"where": where, "type": type(exc).__name__, "message": str(exc)[:500]})
+
+    def finish(self):
+        self.finished = time.time()
+
+    def to_dict(self):
+        with self.lock:
+            signatures = sorted(set(self.latencies) | set(self.tokens) | set(self.failures))
+            return {
+                "format": TRACE_FORMAT,
+                "audit_id": self.audit_id,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                "wall_seconds": round((self.finished or time.time()) - self.started, 3),
+                "stages": {name: round(sec, 4) for name, sec in sorted(self.stages.items())},
+                "llm": {sig: {"calls": len(self.latencies[sig]), "failures": self.failures[sig],
+                              "latency_ms": percentiles_ms(self.latencies[sig]),
+                              "prompt_tokens": self.tokens[sig]["prompt"],
+                              "completion_tokens": self.tokens[sig]["completion"]} for sig in signatures},
+                "cache": {kind: {"hits": c["hits"], "misses": c["misses"],
+                                 "hit_rate": round(c["hits"] / (c["hits"] + c["misses"]), 3) if c["hits"] + c["misses"] else 0.0}
+                          for kind, c in sorted(self.cache.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "errors": list(self.errors),
+            }
@@ -0,0 +1,108 @@
+"""
+Dense vector index over the knowledge base.
+
+Rows are L2-normalized once and stored as float32 in an .npy file beside the KB
+JSON, so later starts memory-map the matrix instead of re-parsing ~33MB of JSON.
+Cosine similarity for a whole batch of queries is then one matrix multiply,
+and top-k uses argpartition instead of a full sort.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+INDEX_FORMAT = 2
+DEFAULT_EMBED_MODEL = "text-embedding-3-small"   # KBs predating the builder carry no model tag
+
+
+def _sidecar_paths(kb_path):
+    stem, _ = os.path.splitext(kb_path)
+    return stem + ".index.npy", stem + ".index.json"
+
+
+def _normalize(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class KBIndex:
+    def __init__(self, facts, matrix, version="none", embed_model=DEFAULT_EMBED_MODEL):
+        self.facts = facts          # "Q: ... | A: ..." strings, row-aligned with matrix
+        self.matrix = matrix        # (N, D) float32, rows L2-normalized (possibly a read-only memmap)
+        self.version = version      # content hash of the source KB JSON
+        self.embed_model = embed_model
+
+    def __len__(self):
+        return len(self.facts)
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.zeros((0, 0), dtype=np.float32))
+
+    @classmethod
+    def load(cls, kb_path):
+        """
+        Loads the index for `kb_path`, memory-mapping the sidecar files when they are
+        current and rebuilding them from the JSON otherwise. A missing or unreadable
+        KB gives an empty index.
+        """
+        if not os.path.exists(kb_path): return cls.empty()
+        npy_path, meta_path = _sidecar_paths(kb_path)
+        st = os.stat(kb_path)
+        try:
+            with open(meta_path, "r") as f: meta = json.load(f)
+            if (meta.get("format") == INDEX_FORMAT and meta.get("source_size") == st.st_size
+                    and meta.get("source_mtime") == st.st_mtime):
+                return cls(meta["facts"], np.load(npy_path, mmap_mode="r"), meta["version"], meta["embed_model"])
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.build(kb_path)
+
+    @classmethod
+    def build(cls, kb_path):
+        """Parses the KB JSON, normalizes its embeddings and (best effort) writes the sidecars."""
+        with open(kb_path, "rb") as f: raw = f.read()
+        version = hashlib.sha256(raw).hexdigest()[:16]
+        data = [e for e in json.loads(raw) if "embedding" in e]
+        facts = [f"Q: {e.get('question','')} | A: {e.get('answer','')}" for e in data]
+        if not data: return cls([], np.zeros((0, 0), dtype=np.float32), version)
+        matrix = _normalize([e["embedding"] for e in data])
+        index = cls(facts, matrix, version, data[0].get("embed_model", DEFAULT_EMBED_MODEL))
+        try:
+            index.save(kb_path)
+        except OSError:
+            pass  # read-only deploys still work, they just rebuild in memory each start
+        return index
+
+    def save(self, kb_path):
+        npy_path, meta_path = _sidecar_paths(kb_path)
+        st = os.stat(kb_path)
+        np.save(npy_path + ".tmp.npy", np.ascontiguousarray(self.matrix, dtype=np.float32))
+        os.replace(npy_path + ".tmp.npy", npy_path)
+        meta = {"format": INDEX_FORMAT, "version": self.version, "embed_model": self.embed_model, "source_size": st.st_size,
+                "source_mtime": st.st_mtime, "dim": int(self.matrix.shape[1]), "facts": self.facts}
+        with open(meta_path + ".tmp", "w") as f: json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def scores(self, queries):
+        """Cosine similarity of each query vector against every row: (len(queries), N)."""
+        return _normalize(np.atleast_2d(queries)) @ self.matrix.T
+
+    def search(self, queries, k=2):
+        """
+        Top-k cosine matches for a batch of query vectors.
+        Returns (indices, scores), each shaped (len(queries), k), best match first.
+        """
+        return top_k(self.scores(queries), k)
+
+
+def top_k(sims, k):
+    """Top-k columns per row of a score matrix via argpartition: (indices, scores), best first."""
+    k = min(k, sims.shape[1])
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
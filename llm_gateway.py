@@ -0,0 +1,274 @@
+"""
+Process-wide gateway for LLM calls.
+
+All AuditEngines in a process share one LLMGateway. The app builds it with
+st.cache_resource; batch_audit.py builds one per run. Gateways given the same
+SharedBudget file (the app and batch_audit.py use .audit_llm_budget.sqlite3)
+share their budget window, 429 pauses and queue priority across processes. The
+gateway:
+
+    budgets    admits calls against requests-per-minute and tokens-per-minute limits
+               over a sliding 60s window. Tokens are estimated before the call and
+               corrected with the reported usage once it returns.
+    priority   waiting "interactive" calls are admitted before any "batch" call, in
+               this process or (with a SharedBudget) any other
+    retries    rate-limit errors (HTTP 429) pause every caller for the backoff (or the
+               Retry-After the API sent); other transient errors (5xx, timeouts) retry
+               just that call. Both use exponential backoff with jitter.
+    coalescing a call whose key matches one already in flight waits for that call's
+               result instead of making its own request
+
+The engine passes its audit-cache key as the coalescing key, so the same sentence
+audited in two sessions at once costs one API call.
+"""
+import heapq
+import itertools
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+WINDOW_SECONDS = 60.0
+SHARED_POLL_SECONDS = 0.2       # how often a queued call re-reads a SharedBudget
+QUEUED_TTL_SECONDS = 5.0        # a process's queued-call count older than this is ignored (it has exited)
+TRANSIENT_STATUS = {408, 409, 500, 502, 503, 504}
+TRANSIENT_ERRORS = {"Timeout", "APITimeoutError", "APIConnectionError", "ServiceUnavailableError", "InternalServerError"}
+
+
+def is_rate_limit(exc):
+    return getattr(exc, "status_code", None) == 429 or "RateLimit" in type(exc).__name__
+
+
+def is_transient(exc):
+    return getattr(exc, "status_code", None) in TRANSIENT_STATUS or type(exc).__name__ in TRANSIENT_ERRORS
+
+
+def retry_after(exc):
+    """Seconds from the error's Retry-After header, if it carries one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def budget_wait(window, tokens, rpm, tpm, now):
+    """
+    Seconds from `now` until a call of `tokens` fits `rpm` / `tpm` (<= 0: admit now).
+    `window` is [(admitted at, tokens)] for the calls in the last minute, oldest first.
+    """
+    wait = 0.0
+    if rpm and len(window) >= rpm:
+        wait = max(wait, window[len(window) - rpm][0] + WINDOW_SECONDS - now)
+    total = sum(n for _, n in window)
+    if tpm and window and total + tokens > tpm:
+        # A call bigger than the whole budget still goes through once the window is empty.
+        excess, freed = total + tokens - tpm, 0
+        for admitted, n in window:
+            freed += n
+            if freed >= excess:
+                wait = max(wait, admitted + WINDOW_SECONDS - now)
+                break
+        else:
+            wait = max(wait, window[-1][0] + WINDOW_SECONDS - now)
+    return wait
+
+
+class SharedBudget:
+    """
+    The calls admitted in the last minute, the 429 pause and the number of queued
+    "interactive" calls per process, in a SQLite file that several processes' gateways
+    use at once. Times are wall-clock, since monotonic clocks differ between processes.
+    Each gateway still applies its own rpm / tpm, to everyone's calls combined.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS calls (id INTEGER PRIMARY KEY, at REAL NOT NULL, tokens INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS calls_at ON calls(at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS queued (pid INTEGER PRIMARY KEY, interactive INTEGER NOT NULL, updated REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pause (id INTEGER PRIMARY KEY CHECK (id = 0), until REAL NOT NULL)")
+
+    # The gateway calls these under its own lock, so one connection serves all its threads.
+    def record(self, tokens):
+        now = time.time()
+        self._db.execute("DELETE FROM calls WHERE at <= ?", (now - WINDOW_SECONDS,))
+        return self._db.execute("INSERT INTO calls(at, tokens) VALUES (?,?)", (now, tokens)).lastrowid
+
+    def settle(self, call_id, tokens):
+        self._db.execute("UPDATE calls SET tokens=? WHERE id=?", (tokens, call_id))
+
+    def pause(self, until):
+        self._db.execute("INSERT INTO pause(id, until) VALUES (0, ?) ON CONFLICT(id) DO UPDATE SET until=max(until, excluded.until)",
+                         (until,))
+
+    def set_queued(self, interactive):
+        self._db.execute("INSERT OR REPLACE INTO queued(pid, interactive, updated) VALUES (?,?,?)",
+                         (self.pid, interactive, time.time()))
+
+    def state(self, now):
+        """([(admitted at, tokens)] for the last minute, paused until, "interactive" calls queued in other processes)."""
+        window = self._db.execute("SELECT at, tokens FROM calls WHERE at > ? ORDER BY at", (now - WINDOW_SECONDS,)).fetchall()
+        row = self._db.execute("SELECT until FROM pause").fetchone()
+        queued = self._db.execute("SELECT COALESCE(SUM(interactive), 0) FROM queued WHERE pid != ? AND updated > ?",
+                                  (self.pid, now - QUEUED_TTL_SECONDS)).fetchone()[0]
+        return window, row[0] if row else 0.0, queued
+
+
+class LLMGateway:
+    """
+    `rpm` / `tpm` of None means no limit; coalescing and retries still apply. With
+    `shared` (a SharedBudget), the limits count every process's calls.
+    """
+    def __init__(self, rpm=None, tpm=None, max_retries=5, base_backoff=1.0, max_backoff=60.0, shared=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.shared = shared
+        self.stats = Counter()
+        self._cond = threading.Condition()
+        self._window = deque()          # [admitted at, tokens, still counted, shared call id] per call in the last minute
+        self._window_tokens = 0
+        self._waiting = []              # heap of (priority, arrival) tickets
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0
+        self._inflight = {}             # coalescing key -> Future of the leading call
+        self._published = (0, 0.0)      # queued interactive calls last written to `shared`, and when
+
+    def call(self, key, tokens, fn, priority="interactive", trace=None, used=None):
+        """
+        Runs fn() once budget allows and returns its result. `tokens` is the estimated
+        cost of the call and `used(result)` its actual token count. Calls with the same
+        non-None `key` in flight at once share one fn() call. `trace` (an AuditTrace)
+        gets the time spent queued and coalesced / rate-limited counts.
+        """
+        if key is None: return self._call_with_retries(tokens, fn, PRIORITIES[priority], trace, used)
+        with self._cond:
+            leader = self._inflight.get(key)
+            if leader is None: self._inflight[key] = mine = Future()
+        if leader is not None:
+            self._count(trace, "coalesced")
+            return leader.result()
+        try:
+            result = self._call_with_retries(tokens, fn, PRIORITIES[priority], trace, used)
+        except BaseException as e:
+            mine.set_exception(e)
+            raise
+        else:
+            mine.set_result(result)
+            return result
+        finally:
+            with self._cond: self._inflight.pop(key, None)
+
+    def snapshot(self):
+        """Counts for this process; the last-minute window is every process's with a SharedBudget."""
+        with self._cond:
+            self._expire(time.monotonic())
+            window_requests, window_tokens = len(self._window), self._window_tokens
+            if self.shared is not None:
+                window = self.shared.state(time.time())[0]
+                window_requests, window_tokens = len(window), sum(n for _, n in window)
+            return {**{name: self.stats[name] for name in ("calls", "coalesced", "rate_limited", "transient_errors")},
+                    "queued": len(self._waiting), "in_flight": len(self._inflight),
+                    "window_requests": window_requests, "window_tokens": window_tokens}
+
+    def _count(self, trace, name):
+        with self._cond: self.stats[name] += 1
+        if trace is not None: trace.count(f"llm_{name}")
+
+    def _call_with_retries(self, tokens, fn, priority, trace, used):
+        for attempt in range(self.max_retries + 1):
+            entry = self._admit(tokens, priority, trace)
+            try:
+                result = fn()
+            except Exception as e:
+                rate_limited = is_rate_limit(e)
+                if attempt == self.max_retries or not (rate_limited or is_transient(e)): raise
+                delay = min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if rate_limited:
+                    # Everyone backs off: the limit is per API key, not per caller.
+                    delay = retry_after(e) or delay
+                    with self._cond:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                        if self.shared is not None: self.shared.pause(time.time() + delay)
+                        self._cond.notify_all()
+                    self._count(trace, "rate_limited")
+                else:
+                    self._count(trace, "transient_errors")
+                    time.sleep(delay)
+                continue
+            actual = used(result) if used is not None else 0
+            if actual: self._settle(entry, actual)      # keep the estimate when the LM reports no usage
+            return result
+
+    def _admit(self, tokens, priority, trace):
+        t0 = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            self._cond.notify_all()     # a higher-priority arrival takes over the head of the queue
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        wait = self._wait_time(tokens, priority)
+                        if wait <= 0: break
+                        # Other processes can't notify us, so a shared budget is re-read as it goes.
+                        self._cond.wait(wait if self.shared is None else min(wait, SHARED_POLL_SECONDS))
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._publish_queued()
+            entry = [time.monotonic(), tokens, True, self.shared.record(tokens) if self.shared is not None else None]
+            self._window.append(entry)
+            self._window_tokens += tokens
+            self.stats["calls"] += 1
+            self._cond.notify_all()
+        waited = time.monotonic() - t0
+        if trace is not None: trace.add_time("llm_queue", waited)
+        return entry
+
+    def _settle(self, entry, actual):
+        with self._cond:
+            if entry[2]: self._window_tokens += actual - entry[1]
+            entry[1] = actual
+            if entry[3] is not None: self.shared.settle(entry[3], actual)
+
+    def _expire(self, now):
+        while self._window and self._window[0][0] <= now - WINDOW_SECONDS:
+            entry = self._window.popleft()
+            entry[2] = False
+            self._window_tokens -= entry[1]
+
+    def _publish_queued(self):
+        # Lets other processes' "batch" calls see ours waiting; refreshed while any are, cleared once none are.
+        if self.shared is None: return
+        queued, now = sum(1 for p, _ in self._waiting if p == PRIORITIES["interactive"]), time.time()
+        if queued != self._published[0] or (queued and now - self._published[1] > QUEUED_TTL_SECONDS / 2):
+            self.shared.set_queued(queued)
+            self._published = (queued, now)
+
+    def _wait_time(self, tokens, priority):
+        # Seconds until a call of `tokens` at `priority` may go (<= 0: admit now).
+        now = time.monotonic()
+        self._expire(now)
+        wait = self._paused_until - now
+        if self.shared is None:
+            return max(wait, budget_wait([(admitted, n) for admitted, n, _, _ in self._window], tokens, self.rpm, self.tpm, now))
+        # Every process's calls count against the budgets, and their queued interactive calls go first.
+        wall = time.time()
+        window, paused_until, interactive_elsewhere = self.shared.state(wall)
+        wait = max(wait, paused_until - wall, budget_wait(window, tokens, self.rpm, self.tpm, wall))
+        if priority > PRIORITIES["interactive"] and interactive_elsewhere: wait = max(wait, SHARED_POLL_SECONDS)
+        if wait > 0: self._publish_queued()
+        return wait
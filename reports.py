@@ -0,0 +1,70 @@
+"""
+Report rendering for exported findings.
+
+    html   the styled report handed to writers (cards, notes at the top)
+    json   compact: title, date, notes, status counts and one object per finding
+    csv    one row per finding, for dashboards and spreadsheets
+
+Every format is written in one pass into a list of parts or a StringIO, so the cost
+stays linear in the number of findings. Callers memoize on the selection (see
+auditor_app.py); nothing here depends on Streamlit.
+"""
+import csv
+import io
+import json
+import time
+from collections import Counter
+
+REPORT_FORMATS = {"html": "text/html", "json": "application/json", "csv": "text/csv"}
+REPORT_FIELDS = ["section", "status", "label", "header", "quote", "route", "route_reason"]
+SECTION_TITLES = {"structure": "SEO and AEO Structure Audit", "facts": "Facts, Grammar, and Style Audit"}
+STATUS_CSS = {"FAIL": "fail-box", "WARN": "warn-box", "PASS": "pass-box"}
+
+
+def report_rows(s_logs, f_logs):
+    """One flat dict per finding, structure findings first, with REPORT_FIELDS keys."""
+    for section, logs in (("structure", s_logs), ("facts", f_logs)):
+        for r in logs:
+            yield {"section": section, **{k: r.get(k, "") for k in REPORT_FIELDS[1:]}}
+
+
+def html_report(s_logs, f_logs, title, notes, css="", include_pass=True, date=None):
+    date = date or time.strftime("%Y-%m-%d")
+    parts = [f"""<html><head><style>{css} body {{ padding: 40px; max-width: 800px; margin: 0 auto; }}</style></head><body>
+    <div style="text-align:center;"><h1>{title}</h1><p>{date}</p></div>
+    {f'<div style="background:#f4f4f4; padding:15px; margin-bottom:20px;"><strong>Notes:</strong><br>{notes}</div>' if notes else ''}"""]
+
+    for section, logs in (("structure", s_logs), ("facts", f_logs)):
+        shown = [r for r in logs if include_pass or r['status'] != 'PASS']
+        if not shown: continue
+        parts.append(f"<h3>{SECTION_TITLES[section]}</h3>")
+        for r in shown:
+            label_html = f"<span class='meta-label'>{r.get('label','')}</span>" if r.get('label') else ""
+            status = f"[{r['status']}] " if section == "facts" else ""
+            parts.append(f"<div class='{STATUS_CSS.get(r['status'], 'pass-box')}'>{label_html}<strong>{status}{r['header']}</strong><br><em>{r['quote']}</em></div>")
+
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def json_report(s_logs, f_logs, title, notes, date=None):
+    rows = list(report_rows(s_logs, f_logs))
+    return json.dumps({"title": title, "date": date or time.strftime("%Y-%m-%d"), "notes": notes or "",
+                       "counts": dict(Counter(r["status"] for r in rows)), "findings": rows},
+                      separators=(",", ":"), ensure_ascii=False)
+
+
+def csv_report(s_logs, f_logs):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(report_rows(s_logs, f_logs))
+    return out.getvalue()
+
+
+def render_report(fmt, s_logs, f_logs, title, notes, css="", date=None):
+    """Report in `fmt` ('html', 'json' or 'csv') as a string."""
+    if fmt == "html": return html_report(s_logs, f_logs, title, notes, css, date=date)
+    if fmt == "json": return json_report(s_logs, f_logs, title, notes, date)
+    if fmt == "csv": return csv_report(s_logs, f_logs)
+    raise ValueError(f"Unknown report format {fmt!r}; expected one of {', '.join(REPORT_FORMATS)}")
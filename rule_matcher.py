@@ -0,0 +1,101 @@
+"""
+Compiled matcher for larry_rules.json.
+
+Every trigger and `must_also_contain` phrase across all rules is compiled into a
+single Aho-Corasick automaton, so a sentence is lowercased and scanned once no
+matter how many rules there are. A match must start on a word boundary, so
+"imagine" no longer fires inside "reimagined"; it may end mid-word, so
+"direct deposits", "free scans" and "bank" in "banking" still count, as they did
+with the plain substring checks this replaced (tools/check_rule_matcher.py checks
+that they all still fire).
+"""
+from collections import deque, namedtuple
+
+RuleHit = namedtuple("RuleHit", ["rule", "triggers", "qualifiers"])
+
+TRIGGER, QUALIFIER = 0, 1
+
+
+def _normalize(text):
+    # Curly apostrophes from CMS/Word pastes should still match "driver's license".
+    return text.lower().replace("’", "'").replace("‘", "'")
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class RuleMatcher:
+    def __init__(self, rules):
+        self.rules = rules
+        self.patterns = []                  # normalized phrase per pattern id
+        self.pattern_refs = []              # [(rule index, TRIGGER|QUALIFIER)] per pattern id
+        self.qualifier_ids = []             # pattern ids each rule needs (all of them)
+        ids = {}
+        for r_idx, rule in enumerate(rules):
+            needed = []
+            for kind, phrases in ((TRIGGER, rule.get("triggers", [])), (QUALIFIER, rule.get("must_also_contain", []))):
+                for phrase in phrases:
+                    p = _normalize(phrase).strip()
+                    if not p: continue
+                    if p not in ids:
+                        ids[p] = len(self.patterns)
+                        self.patterns.append(p)
+                        self.pattern_refs.append([])
+                    self.pattern_refs[ids[p]].append((r_idx, kind))
+                    if kind == QUALIFIER: needed.append(ids[p])
+            self.qualifier_ids.append(needed)
+        self._compile()
+
+    def _compile(self):
+        # Trie + failure links; `out` holds every pattern id that ends at a node.
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for pid, p in enumerate(self.patterns):
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append([])
+                node = nxt
+            self.out[node].append(pid)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def scan(self, text):
+        """Set of pattern ids found in `text` starting on a word boundary."""
+        text = _normalize(text)
+        goto, fail, out, patterns = self.goto, self.fail, self.out, self.patterns
+        found, node = set(), 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]: node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                if pid in found: continue
+                p = patterns[pid]
+                start = i - len(p) + 1
+                if _is_word_char(p[0]) and start > 0 and _is_word_char(text[start - 1]): continue
+                found.add(pid)
+        return found
+
+    def match(self, sentence):
+        """Every rule whose trigger and all `must_also_contain` phrases occur, in file order."""
+        found = self.scan(sentence)
+        triggered = {}
+        for pid in found:
+            for r_idx, kind in self.pattern_refs[pid]:
+                if kind == TRIGGER: triggered.setdefault(r_idx, []).append(self.patterns[pid])
+        hits = []
+        for r_idx in sorted(triggered):
+            needed = self.qualifier_ids[r_idx]
+            if all(q in found for q in needed):
+                hits.append(RuleHit(self.rules[r_idx], triggered[r_idx], [self.patterns[q] for q in needed]))
+        return hits
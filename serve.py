@@ -0,0 +1,27 @@
+"""
+Runs the auditor with its warm-up started by the process, not by the first visitor.
+
+    python serve.py [streamlit run options]     # e.g. --server.port=8501
+
+Same as `streamlit run auditor_app.py [options]`, except that the warm-up (see
+warmup.py) starts before Streamlit serves, so a fresh instance with no traffic
+still becomes ready to audit and `python warmup.py --check` can gate a deploy.
+The app runs in this process and picks up the same warm-up.
+"""
+import os
+import sys
+
+from warmup import BASE_DIR, audit_warmup
+
+APP_PATH = os.path.join(BASE_DIR, "auditor_app.py")
+
+
+def main(argv=None):
+    audit_warmup()
+    from streamlit.web import cli
+    sys.argv = ["streamlit", "run", APP_PATH] + list(sys.argv[1:] if argv is None else argv)
+    cli.main()
+
+
+if __name__ == "__main__":
+    main()
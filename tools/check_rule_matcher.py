@@ -0,0 +1,83 @@
+"""
+Regression check for rule_matcher.py against the substring checks it replaced.
+
+    python tools/check_rule_matcher.py [rules.json] [pages dir or .zip]
+
+Checks that every hit of the original `phrase in sentence` checks, on the rules'
+own phrases (plain and inflected) and on the pages' sentences, still fires with
+RuleMatcher, apart from phrases that only occur starting mid-word. Exits with
+status 1 if any is missed.
+"""
+import json
+import os
+import re
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from rule_matcher import RuleMatcher, _is_word_char, _normalize
+
+INFLECTIONS = ("", "s", "es", "ed", "ing", "'s")
+
+
+def substring_match(rules, sentence):
+    """Indices of the rules the original `phrase in sentence` checks fire on."""
+    text = _normalize(sentence)
+    return [i for i, r in enumerate(rules)
+            if any(_normalize(t) in text for t in r.get("triggers", []))
+            and all(_normalize(m) in text for m in r.get("must_also_contain", []))]
+
+
+def _starts_on_boundary(text, phrase):
+    return any(m.start() == 0 or not _is_word_char(text[m.start() - 1]) or not _is_word_char(phrase[0])
+               for m in re.finditer(re.escape(phrase), text))
+
+
+def regressions(rules, sentences):
+    """
+    [(sentence, rule index)] for substring hits the matcher misses. Hits where a
+    phrase only occurs starting mid-word ("imagine" in "reimagined") are expected misses.
+    """
+    matcher = RuleMatcher(rules)
+    missed = []
+    for sent in sentences:
+        text, fired = _normalize(sent), {id(h.rule) for h in matcher.match(sent)}
+        for i in substring_match(rules, sent):
+            r = rules[i]
+            phrases = [t for t in r.get("triggers", []) if _normalize(t) in text][:1] + r.get("must_also_contain", [])
+            if all(_starts_on_boundary(text, _normalize(p)) for p in phrases) and id(r) not in fired:
+                missed.append((sent, i))
+    return missed
+
+
+def probe_sentences(rules):
+    """Each rule's triggers with every inflection, followed by its qualifiers inflected the same way."""
+    for r in rules:
+        for t in r.get("triggers", []):
+            for suffix in INFLECTIONS:
+                yield f"We said {t}{suffix} about " + " and ".join(f"{m}{suffix}" for m in r.get("must_also_contain", [])) + "."
+
+
+def page_sentences(source):
+    from bs4 import BeautifulSoup
+    from build_kb import read_pages
+    for _, raw in read_pages(source):
+        text = BeautifulSoup(raw.decode("utf-8", errors="ignore"), "html.parser").get_text(" ")
+        yield from (s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rules_path = argv[0] if argv else os.path.join(BASE_DIR, "larry_rules.json")
+    source = argv[1] if len(argv) > 1 else os.path.join(BASE_DIR, "ipostal1_source")
+    with open(rules_path, "r") as f: rules = json.load(f)
+    sentences = list(probe_sentences(rules)) + (list(page_sentences(source)) if os.path.exists(source) else [])
+    missed = regressions(rules, sentences)
+    for sent, i in missed[:20]: print(f"MISSED rule {i}: {sent[:120]}")
+    print(f"{len(sentences)} sentences, {sum(len(substring_match(rules, s)) > 0 for s in sentences)} with substring hits, {len(missed)} missed")
+    sys.exit(1 if missed else 0)
+
+
+if __name__ == "__main__":
+    main()
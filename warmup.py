@@ -0,0 +1,197 @@
+"""
+Background warm-up for a fast cold start.
+
+The login screen paints with only Streamlit imported. A Warmup thread loads what
+an audit needs (dspy, openai, the engine modules, the KB index and the rules) in
+the background, so after login the app waits for it, usually for no time at all.
+
+    starting -> warming -> ready | failed
+
+There is one warm-up per process (audit_warmup()). Started through serve.py, it
+begins with the process, before Streamlit serves anything; under a plain
+`streamlit run auditor_app.py` the first page load starts it. Either way it runs
+once per process, not per visitor. This loads the heavy modules before login on
+purpose: waiting for a login would leave an idle instance never ready to audit.
+A failed warm-up is started again by the next page load.
+
+Streamlit's /_stcore/health answers as soon as the login page is served. "Ready
+to audit" is written to a small JSON status file (READY_FILE) as the state
+changes, so a container probe or a deploy script can wait for it:
+
+    python warmup.py --check     # exit 0 once this process's warm-up is ready
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+READY_FILE = os.environ.get("AUDIT_READY_FILE", os.path.join(BASE_DIR, ".audit_ready.json"))
+KB_PATH = os.path.join(BASE_DIR, "ipostal1_knowledge_base.json")
+RULES_PATH = os.path.join(BASE_DIR, "larry_rules.json")
+OVERRIDES_PATH = os.path.join(BASE_DIR, "overrides.json")
+# Imported by the warm-up thread, in this order, so the app's own imports after login are no-ops.
+HEAVY_MODULES = ("numpy", "bs4", "openai", "dspy", "streamlit_quill", "audit_engine", "embeddings",
+                 "retrieval", "audit_cache", "audit_jobs", "llm_gateway", "reports")
+FIRST_PAINT_BUDGET_MS = 1000    # one cold script run up to the login screen
+
+
+class Warmup:
+    """
+    Runs `steps` ([(name, fn)]) in order on a daemon thread and keeps each result
+    under its name. `status_path` (if set) gets the state as JSON on every change.
+    Steps report problems that don't stop the warm-up through warn(message).
+    """
+    def __init__(self, steps, status_path=None):
+        self.steps = list(steps)
+        self.status_path = status_path
+        self.state = "starting"
+        self.results = {}
+        self.step_ms = {}
+        self.error = None
+        self.warnings = []
+        self.first_paint_ms = None
+        self.started = time.time()
+        self.finished = None
+        self._exc = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._write_status()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def result(self, name, timeout=None):
+        """
+        Waits for warm-up and returns the result of step `name`. Re-raises the error
+        that stopped the warm-up, and raises TimeoutError if `timeout` passes first.
+        """
+        if not self._done.wait(timeout): raise TimeoutError(f"Warm-up still running after {timeout}s")
+        if self._exc is not None: raise self._exc
+        return self.results[name]
+
+    def warn(self, message):
+        with self._lock: self.warnings.append(message)
+        self._write_status()
+
+    def record_first_paint(self, ms):
+        # Only the first paint in the process is the cold one.
+        with self._lock:
+            if self.first_paint_ms is not None: return
+            self.first_paint_ms = round(ms)
+        self._write_status()
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "pid": os.getpid(), "started": self.started, "finished": self.finished,
+                    "seconds": round((self.finished or time.time()) - self.started, 3), "steps_ms": dict(self.step_ms),
+                    "first_paint_ms": self.first_paint_ms, "first_paint_budget_ms": FIRST_PAINT_BUDGET_MS,
+                    "error": self.error, "warnings": list(self.warnings)}
+
+    def _run(self):
+        self._set_state("warming")
+        try:
+            for name, fn in self.steps:
+                t0 = time.perf_counter()
+                self.results[name] = fn()
+                with self._lock: self.step_ms[name] = round((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            self._exc = e
+            with self._lock: self.error = f"{type(e).__name__}: {e}"
+            self._set_state("failed")
+        else:
+            self._set_state("ready")
+        finally:
+            self._done.set()
+
+    def _set_state(self, state):
+        with self._lock:
+            self.state = state
+            if state in ("ready", "failed"): self.finished = time.time()
+        self._write_status()
+
+    def _write_status(self):
+        if not self.status_path: return
+        tmp = f"{self.status_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f: json.dump(self.snapshot(), f)
+            os.replace(tmp, self.status_path)
+        except OSError:
+            pass  # read-only deploys still serve; they just can't be probed this way
+
+
+def import_steps(modules=HEAVY_MODULES):
+    return [(m, partial(importlib.import_module, m)) for m in modules]
+
+
+def read_data(warn=None):
+    """
+    (kb_index, rules, overrides, kb_error). A KB that is missing, unreadable or has no
+    embedded entries gives an empty index and the reason as `kb_error` (an exception),
+    also passed to `warn(message)`: audits still run, without KB context.
+    """
+    from kb_index import KBIndex
+    rules, ovr, kb_error = [], [], None
+    try:
+        if not os.path.exists(KB_PATH): raise FileNotFoundError(f"No knowledge base at {KB_PATH}")
+        kb_index = KBIndex.load(KB_PATH)
+        if not len(kb_index): raise ValueError(f"{KB_PATH} has no embedded entries")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        kb_index, kb_error = KBIndex.empty(), e
+        if warn: warn(f"KB not loaded, audits run without KB context: {type(e).__name__}: {e}")
+    if os.path.exists(RULES_PATH): 
+        with open(RULES_PATH, 'r') as f: rules = json.load(f)
+    if os.path.exists(OVERRIDES_PATH):
+        with open(OVERRIDES_PATH, 'r') as f: ovr = json.load(f)
+    return kb_index, rules, ovr, kb_error
+
+
+_audit_warmup = None
+_audit_warmup_lock = threading.Lock()
+
+
+def audit_warmup():
+    """The process's warm-up of everything an audit needs: started on first call, and again if the last one failed."""
+    global _audit_warmup
+    with _audit_warmup_lock:
+        if _audit_warmup is None or _audit_warmup.state == "failed":
+            _audit_warmup = Warmup(import_steps(), READY_FILE)
+            _audit_warmup.steps.append(("data", partial(read_data, warn=_audit_warmup.warn)))
+            _audit_warmup.start()
+        return _audit_warmup
+
+
+def read_status(path=READY_FILE):
+    """The status a Warmup last wrote to `path`, or None if there is none or its process has exited."""
+    try:
+        with open(path, "r") as f: status = json.load(f)
+        os.kill(status["pid"], 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return status
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Report whether the running auditor has finished warming up.")
+    ap.add_argument("--check", action="store_true", help="exit 0 if ready to audit, 1 otherwise")
+    ap.add_argument("--status-file", default=READY_FILE, help="status file the app writes")
+    args = ap.parse_args(argv)
+    status = read_status(args.status_file)
+    if not args.check:
+        print(json.dumps(status, indent=1))
+        return
+    sys.exit(0 if status and status["state"] == "ready" else 1)
+
+
+if __name__ == "__main__":
+    main()